@@ -0,0 +1,270 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable
+
+import aiohttp
+from multidict import CIMultiDict
+
+from llm_stream import LLMHTTPError
+from telemetry import Counter, Gauge
+
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "8"))   # 0 disables the rate limit
+LLM_BURST = int(os.getenv("LLM_BURST", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+MAX_RETRY_AFTER = 60.0
+WAIT_UPDATE_SECONDS = 1.0
+
+# Interactive previews are admitted before bulk generation.
+INTERACTIVE, BULK = 0, 1
+
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+
+QUEUE_DEPTH = Gauge("story_llm_queue_depth", "LLM calls waiting for admission")
+REJECTED = Counter("story_llm_rejected_total", "LLM calls failed fast by the open circuit breaker")
+THROTTLED = Counter("story_llm_throttled_total", "LLM responses asking to slow down, by status")
+
+
+class LLMUnavailable(Exception):
+    def __init__(self, retry_in: float):
+        super().__init__(f"The LLM service is unavailable right now; try again in about {max(retry_in, 1):.0f}s.")
+        self.retry_in = retry_in
+
+
+def retry_after_seconds(value) -> float | None:
+    """
+    Parses a Retry-After header (delta seconds or an HTTP date), capped at MAX_RETRY_AFTER.
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def _failure(error) -> tuple[bool, int | None, CIMultiDict]:
+    """
+    (is a backend failure, HTTP status or None for transport errors, response headers).
+    """
+    if isinstance(error, LLMHTTPError):
+        return True, error.status, error.headers
+    if isinstance(error, aiohttp.ClientResponseError):
+        return True, error.status, CIMultiDict(error.headers or {})
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+        return True, None, CIMultiDict()
+    return False, None, CIMultiDict()
+
+
+class AdmissionGate:
+    """
+    Process-wide admission control in front of an LLM backend:
+
+    - a token bucket (`rate` calls/s, bursts of `burst`) with a priority queue,
+      so interactive calls overtake queued bulk ones;
+    - Retry-After from 429/503 responses pauses every admission, not just the
+      call that got it, and that call is retried;
+    - a circuit breaker that opens after `failure_threshold` consecutive
+      5xx/transport failures and fails fast with LLMUnavailable for `cooldown`
+      seconds, then lets calls through again to probe the backend.
+    """
+
+    def __init__(self, rate: float = LLM_RATE_PER_SECOND, burst: int = LLM_BURST,
+                 max_retries: int = LLM_MAX_RETRIES, failure_threshold: int = BREAKER_FAILURES,
+                 cooldown: float = BREAKER_COOLDOWN):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_retries = max_retries
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.tokens = float(self.burst)
+        self.failures = 0
+        self.opened_at = None
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer = None
+
+    # --- token bucket and queue ---
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        else:
+            self.tokens = self.burst
+        self._updated = now
+
+    def _take(self, now: float) -> bool:
+        self._refill(now)
+        if now < self._paused_until or self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _dispatch(self):
+        self._timer = None
+        now = time.monotonic()
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._take(now):
+                break
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+        QUEUE_DEPTH.set(self.queue_depth())
+        if self._waiters and self._timer is None:
+            delay = max(self._paused_until - now, (1 - self.tokens) / self.rate if self.rate > 0 else 0, 0.01)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _position(self, future) -> int:
+        waiting = sorted(entry for entry in self._waiters if not entry[2].done())
+        return next((i for i, entry in enumerate(waiting, 1) if entry[2] is future), 0)
+
+    def estimated_wait(self, position: int) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        paused = max(self._paused_until - now, 0.0)
+        if self.rate <= 0:
+            return paused
+        return paused + max(position - self.tokens, 0.0) / self.rate
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority: int = INTERACTIVE,
+                      on_wait: Callable[[int, float], Awaitable[None]] | None = None):
+        """
+        Waits for an admission slot. While queued, `on_wait(position, eta)` is
+        awaited about every second; once admitted after waiting it is called
+        with position 0.
+        """
+        self._check_breaker()
+        if not self._waiters and self._take(time.monotonic()):
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        try:
+            while not future.done():
+                if on_wait is not None:
+                    position = self._position(future)
+                    await on_wait(position, self.estimated_wait(position))
+                await asyncio.wait({future}, timeout=WAIT_UPDATE_SECONDS)
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.tokens = min(self.burst, self.tokens + 1)  # admitted but no longer wanted
+            future.cancel()
+            self._dispatch()
+            raise
+        if on_wait is not None:
+            await on_wait(0, 0.0)
+
+    # --- circuit breaker ---
+
+    def _check_breaker(self):
+        if self.opened_at is None:
+            return
+        remaining = self.opened_at + self.cooldown - time.monotonic()
+        if remaining > 0:
+            REJECTED.inc()
+            raise LLMUnavailable(remaining)
+        # Cooldown over: half-open, calls go through and the next outcome decides.
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+    def _should_retry(self, error, attempt: int) -> bool:
+        is_failure, status, headers = _failure(error)
+        if not is_failure:
+            return False
+        if status in (429, 503):
+            THROTTLED.inc(status=status)
+            self.pause(retry_after_seconds(headers.get("Retry-After")) or min(2 ** attempt, MAX_RETRY_AFTER))
+        if status is None or status >= 500:
+            self.record_failure()
+        elif status != 429:
+            return False
+        return (status is None or status in RETRYABLE_STATUSES) and attempt < self.max_retries
+
+    # --- wrapped calls ---
+
+    async def call(self, fn: Callable[[], Awaitable], priority: int = INTERACTIVE,
+                   on_wait: Callable[[int, float], Awaitable[None]] | None = None):
+        """
+        Returns `await fn()` once admitted, retrying throttled or transient failures.
+        """
+        for attempt in itertools.count():
+            await self.acquire(priority, on_wait)
+            try:
+                result = await fn()
+            except Exception as e:
+                if self._should_retry(e, attempt):
+                    continue
+                raise
+            self.record_success()
+            return result
+
+    async def stream(self, fn: Callable[[], AsyncIterator[str]], priority: int = INTERACTIVE,
+                     on_wait: Callable[[int, float], Awaitable[None]] | None = None) -> AsyncIterator[str]:
+        """
+        Iterates `fn()` once admitted. Failures before the first chunk are
+        retried like `call`; once text has been yielded they are raised.
+        """
+        for attempt in itertools.count():
+            await self.acquire(priority, on_wait)
+            started = False
+            try:
+                async for chunk in fn():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if self._should_retry(e, attempt) and not started:
+                    continue
+                raise
+            self.record_success()
+            return
+
+
+def queue_notice(msg, header: str = ""):
+    """
+    `on_wait` callback showing queue position and estimated wait in a Chainlit
+    message, restoring `header` once the call is admitted.
+    """
+    async def on_wait(position, eta):
+        if position:
+            msg.content = f"{header}⏳ Waiting for the LLM: position {position} in queue, about {max(eta, 1):.0f}s."
+        else:
+            msg.content = header
+        await msg.update()
+    return on_wait
+
+
+_default_gate = None
+
+
+def get_llm_gate() -> AdmissionGate:
+    global _default_gate
+    if _default_gate is None:
+        _default_gate = AdmissionGate()
+    return _default_gate
@@ -0,0 +1,178 @@
+"""
+Headless story generation: ingests a spec, then turns a JSONL of prompts into a
+JSONL of stories with the same convert/ingest/search/LLM steps as the chat apps.
+
+    python batch_cli.py --spec wires.yaml --prompts prompts.jsonl -o stories.jsonl
+    python batch_cli.py --spec wires.yaml -o stories.jsonl          # one story per operation
+
+The output file is also the checkpoint: rerunning the same command skips every
+prompt that already has a story and retries the ones that failed.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+
+import http_client
+from bulk import BULK_CONCURRENCY, BULK_RATE_PER_SECOND, generate_batch, operation_prompts
+from cache import get_cache, normalize_prompt
+from ingest import ingest_spec
+from story_steps import build_prompt, complete_story, story_key
+
+BACKEND_BASE = os.getenv("BACKEND_BASE", "https://your-server.com")           # Change this
+LLM_API = os.getenv("LLM_API", "https://your-apigee-llm.com/generate")        # Change this
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()[:16]
+
+
+def read_prompts(path: str) -> list[tuple[str, str]]:
+    """
+    Reads (key, prompt) pairs from JSONL rows with a `prompt` (or `content` /
+    `title`) field and an optional `id`; bare strings are accepted too. Rows
+    without an id are keyed by their normalized prompt, so reordering the file
+    between runs does not invalidate the checkpoint.
+    """
+    items, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise SystemExit(f"{path}:{line_number}: invalid JSON ({e})")
+            if isinstance(row, str):
+                row = {"prompt": row}
+            prompt = row.get("prompt") or row.get("content") or row.get("title") if isinstance(row, dict) else None
+            if not prompt:
+                raise SystemExit(f"{path}:{line_number}: no prompt field")
+            key = str(row.get("id") or prompt_key(prompt))
+            if key not in seen:
+                seen.add(key)
+                items.append((key, prompt))
+    return items
+
+
+def _drop_partial_line(path: str):
+    # A crash mid-write can leave a torn last line; cut it so appends stay valid JSONL.
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def load_checkpoint(path: str) -> dict:
+    """
+    Returns {key: row} for every prompt that already has a story in `path`.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    _drop_partial_line(path)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if row.get("story") and not row.get("error"):
+                done[row["key"]] = row
+    return done
+
+
+async def write_story(use_case_id, content, backend_base=BACKEND_BASE, llm_api=LLM_API):
+    async def generate():
+        prompt = await build_prompt(use_case_id, content, backend_base)
+        return await complete_story(llm_api, prompt, use_case_id)
+
+    return await get_cache().get_or_compute(story_key(use_case_id, content), generate)
+
+
+async def run(args) -> int:
+    use_case_id = args.use_case_id
+    operations = {}
+    try:
+        if args.spec:
+            with open(args.spec, "rb") as f:
+                source = f.read()
+            result = await ingest_spec(args.backend, source, os.path.basename(args.spec))
+            use_case_id = result.use_case_id
+            operations = result.operations
+            print(f"Spec {result.describe()}; use-case ID: {use_case_id}", file=sys.stderr)
+
+        if args.prompts:
+            items = read_prompts(args.prompts)
+        else:
+            items = operation_prompts(operations, args.by_tag)
+        if not items:
+            print("Nothing to generate.", file=sys.stderr)
+            return 0
+
+        done = load_checkpoint(args.output)
+        pending = [(key, prompt) for key, prompt in items if key not in done]
+        print(f"{len(items)} prompts: {len(items) - len(pending)} already done, {len(pending)} to generate",
+              file=sys.stderr)
+
+        started = time.perf_counter()
+        failed = 0
+        with open(args.output, "a", encoding="utf-8") as out:
+            async def on_result(result, completed, total):
+                nonlocal failed
+                failed += not result.ok
+                out.write(json.dumps({
+                    "key": result.key,
+                    "prompt": result.prompt,
+                    "use_case_id": use_case_id,
+                    "story": result.story if result.ok else "",
+                    "error": "" if result.ok else result.error or "No story generated.",
+                    "seconds": round(result.seconds, 3),
+                }) + "\n")
+                out.flush()
+                status = "ok" if result.ok else f"failed: {result.error or 'empty story'}"
+                print(f"[{completed}/{total}] {result.key} {status} ({result.seconds:.1f}s)", file=sys.stderr)
+
+            await generate_batch(
+                pending,
+                lambda prompt: write_story(use_case_id, prompt, args.backend, args.llm_url),
+                concurrency=args.concurrency,
+                rate=args.rate,
+                on_result=on_result,
+            )
+
+        elapsed = time.perf_counter() - started
+        print(f"Done in {elapsed:.1f}s: {len(pending) - failed} generated, {failed} failed"
+              + (" (rerun to retry them)" if failed else ""), file=sys.stderr)
+        return 1 if failed else 0
+    finally:
+        await http_client.close_session()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Jira stories for a JSONL of prompts without the chat UI.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--spec", help="Swagger/OpenAPI (or Figma) JSON/YAML file to ingest first")
+    source.add_argument("--use-case-id", help="generate against an already ingested use case")
+    parser.add_argument("--prompts", help="JSONL of prompts (default: one prompt per spec operation)")
+    parser.add_argument("--by-tag", action="store_true", help="without --prompts, one story per tag")
+    parser.add_argument("-o", "--output", required=True, help="JSONL of stories; also the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=BULK_RATE_PER_SECOND, help="max LLM calls started per second")
+    parser.add_argument("--backend", default=BACKEND_BASE)
+    parser.add_argument("--llm-url", default=LLM_API)
+    args = parser.parse_args(argv)
+    if not args.prompts and not args.spec:
+        parser.error("--prompts is required with --use-case-id")
+    return args
+
+
+def main(argv=None):
+    sys.exit(asyncio.run(run(parse_args(argv))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,643 @@
+"""
+Offline benchmark for the Chainlit apps.
+
+Runs local stub servers in place of the upload/ingest/search backend, the LLM
+endpoints (apigee and Gemini) and Jira, then drives the apps' handlers with N
+concurrent simulated sessions and reports p50/p95/p99 latency per stage,
+sessions per second and peak RSS.
+
+    python bench.py --app multiplestories --sessions 200 --concurrency 20
+    python bench.py --app all --prompts requests.jsonl --latency llm=800:2500 --fail jira=0.05
+    python bench.py --serve-stub 8765             # stubs only, for pointing a real Chainlit at
+
+Chainlit itself is replaced by an in-process stand-in, so nothing here needs a
+browser or network access.
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import uuid
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import aiohttp
+import yaml
+from aiohttp import web
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+APPS = ("multiplestories", "chainlit", "latest", "newchainlit")
+ROUTES = ("upload", "ingest", "search", "llm", "jira")
+
+# route -> (median ms, p95 ms) of a log-normal latency; for "llm" it is the time to first token
+DEFAULT_LATENCY_MS = {
+    "upload": (80, 250),
+    "ingest": (300, 1200),
+    "search": (60, 200),
+    "llm": (700, 2500),
+    "jira": (150, 500),
+}
+
+STORY_WORDS = (
+    "Feature: Wire transfers As a treasury user I want to initiate a wire so that funds "
+    "reach the receiver Scenario: valid transfer Given a funded sender account When I submit "
+    "the wire Then the transfer is PENDING Acceptance Criteria: amount is positive currency is "
+    "ISO 4217 Epic: Payments Labels: wires Priority: High Subtasks: validation audit logging"
+).split()
+
+
+# --- Stub servers ---
+
+@dataclass
+class StubConfig:
+    latency_ms: dict = field(default_factory=lambda: dict(DEFAULT_LATENCY_MS))
+    failure_rate: dict = field(default_factory=dict)
+    tokens: int = 120
+    token_delay_ms: float = 10
+    search_hits: int = 5
+    seed: int | None = None
+
+
+def sample_latency(median_ms: float, p95_ms: float, rng: random.Random) -> float:
+    """
+    Seconds drawn from a log-normal distribution with the given median and p95.
+    """
+    if median_ms <= 0:
+        return 0.0
+    sigma = math.log(max(p95_ms, median_ms) / median_ms) / 1.645
+    return median_ms * math.exp(rng.gauss(0, sigma)) / 1000
+
+
+def make_stub_app(config: StubConfig) -> web.Application:
+    rng = random.Random(config.seed)
+    use_case_ids = itertools.count(1)
+    jira_keys = {}
+
+    async def delay(route):
+        median, p95 = config.latency_ms.get(route, (0, 0))
+        await asyncio.sleep(sample_latency(median, p95, rng))
+        if rng.random() < config.failure_rate.get(route, 0.0):
+            raise web.HTTPServiceUnavailable(text=f"stub {route} failure", headers={"Retry-After": "0"})
+
+    def story_tokens():
+        return [word + " " for word in itertools.islice(itertools.cycle(STORY_WORDS), config.tokens)]
+
+    async def upload(request):
+        await request.read()
+        await delay("upload")
+        return web.json_response({"file_id": uuid.uuid4().hex})
+
+    async def ingest(request):
+        payload = await request.json()
+        await delay("ingest")
+        return web.json_response({"use_case_id": payload.get("use_case_id") or f"bench-{next(use_case_ids)}"})
+
+    async def search(request):
+        payload = await request.json()
+        await delay("search")
+        query = payload.get("query", "")
+        documents = [
+            {"text": f"Chunk {i} for '{query}': " + " ".join(STORY_WORDS[i:i + 30]), "score": 1.0 / (i + 1)}
+            for i in range(config.search_hits)
+        ]
+        return web.json_response({"context": "\n\n".join(d["text"] for d in documents), "documents": documents})
+
+    async def llm(request):
+        payload = await request.json()
+        gemini = "contents" in payload
+        streaming = request.query.get("alt") == "sse" if gemini else payload.get("stream") is True
+        await delay("llm")
+        tokens = story_tokens()
+
+        if not streaming:
+            await asyncio.sleep(config.token_delay_ms * len(tokens) / 1000)
+            text = "".join(tokens)
+            if gemini:
+                return web.json_response({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+            return web.json_response({"output": text, "generated_text": text})
+
+        response = web.StreamResponse()
+        response.content_type = "text/event-stream"
+        await response.prepare(request)
+        for token in tokens:
+            event = {"candidates": [{"content": {"parts": [{"text": token}]}}]} if gemini else {"token": token}
+            await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            await asyncio.sleep(config.token_delay_ms / 1000)
+        if not gemini:
+            await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def create(key):
+        if key in jira_keys:
+            return 409, {"idempotency_key": key, "status": "duplicate", "key": jira_keys[key]}
+        jira_keys[key] = f"BENCH-{len(jira_keys) + 1}"
+        return 201, {"idempotency_key": key, "status": "created", "key": jira_keys[key]}
+
+    async def jira(request):
+        payload = await request.json()
+        await delay("jira")
+        status, body = create(request.headers.get("Idempotency-Key") or payload.get("idempotency_key") or uuid.uuid4().hex)
+        return web.json_response(body, status=status)
+
+    async def jira_bulk(request):
+        payload = await request.json()
+        await delay("jira")
+        results = []
+        for item in payload.get("stories", []):
+            status, body = create(item.get("idempotency_key") or uuid.uuid4().hex)
+            results.append({**body, "status": "created" if status == 201 else "duplicate"})
+        return web.json_response({"results": results}, status=207)
+
+    app = web.Application(client_max_size=256 * 1024 ** 2)
+    app.router.add_post("/upload", upload)
+    app.router.add_post("/ingest", ingest)
+    app.router.add_post("/search", search)
+    app.router.add_post("/llm", llm)
+    app.router.add_post("/jira", jira)
+    app.router.add_post("/jira/bulk", jira_bulk)
+    return app
+
+
+def serve_stub(port: int, config: StubConfig):
+    web.run_app(make_stub_app(config), host="127.0.0.1", port=port, print=None)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_process(config: StubConfig, timeout: float = 15.0) -> tuple[multiprocessing.Process, str]:
+    """
+    Runs the stubs in a child process so they neither share the event loop nor
+    count towards the benchmarked process's RSS.
+    """
+    port = _free_port()
+    process = multiprocessing.Process(target=serve_stub, args=(port, config), daemon=True)
+    process.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            if time.monotonic() > deadline or not process.is_alive():
+                process.terminate()
+                raise RuntimeError("stub server did not start")
+            time.sleep(0.05)
+
+
+def stub_route(url: str) -> str:
+    """
+    Maps a production URL used by the apps onto the stub route serving it.
+    """
+    parts = urlsplit(url)
+    path = parts.path.rstrip("/")
+    if "jira" in parts.netloc or "jira" in path:
+        return "jira/bulk" if path.endswith("/bulk") else "jira"
+    for route in ("upload", "ingest", "search"):
+        if path.endswith(f"/{route}"):
+            return route
+    return "llm"
+
+
+class StubSession:
+    """
+    Stands in for http_client's pooled session and sends every request to the
+    stub server, keeping the query string (Gemini's `alt=sse`).
+    """
+
+    def __init__(self, stub_url: str, session: aiohttp.ClientSession):
+        self.stub_url = stub_url.rstrip("/")
+        self._session = session
+
+    @property
+    def closed(self) -> bool:
+        return self._session.closed
+
+    def _rewrite(self, url: str) -> str:
+        query = urlsplit(url).query
+        return f"{self.stub_url}/{stub_route(url)}" + (f"?{query}" if query else "")
+
+    def request(self, method: str, url: str, **kwargs):
+        return self._session.request(method, self._rewrite(url), **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self._session.post(self._rewrite(url), **kwargs)
+
+    async def close(self):
+        await self._session.close()
+
+
+# --- Chainlit stand-in ---
+
+_session_state = contextvars.ContextVar("bench_session")
+
+
+class _UserSession:
+    def get(self, key, default=None):
+        return _session_state.get()["data"].get(key, default)
+
+    def set(self, key, value):
+        _session_state.get()["data"][key] = value
+
+
+class _Message:
+    def __init__(self, content="", elements=None, **kwargs):
+        self.content = content
+        self.elements = elements or []
+
+    async def send(self):
+        state = _session_state.get()
+        state["messages"] += 1
+        if self.content.startswith("❌"):
+            state["errors"].append(self.content)
+        return self
+
+    async def stream_token(self, token):
+        self.content += token
+
+    async def update(self, content=None, **kwargs):
+        if content is not None:
+            self.content = content
+        return True
+
+
+class _ErrorMessage(_Message):
+    async def send(self):
+        _session_state.get()["errors"].append(self.content)
+        return self
+
+
+class _File:
+    def __init__(self, name="", content=b"", mime="", path=None, display=None, **kwargs):
+        self.name = name
+        self.content = content
+        self.mime = mime
+        self.path = path
+
+
+class _Files(list):
+    # AskFileMessage().send() is used both as `.files[0]` and `[0]` in these apps.
+    @property
+    def files(self):
+        return self
+
+
+class _AskFileMessage(_Message):
+    async def send(self):
+        return _Files([_session_state.get()["upload"]])
+
+
+class _AskUserMessage(_Message):
+    async def send(self):
+        return _Message(_session_state.get()["prompts"].popleft())
+
+
+def fake_chainlit() -> types.ModuleType:
+    cl = types.ModuleType("chainlit")
+    cl.user_session = _UserSession()
+    cl.Message = _Message
+    cl.ErrorMessage = _ErrorMessage
+    cl.File = _File
+    cl.AskFileMessage = _AskFileMessage
+    cl.AskUserMessage = _AskUserMessage
+    cl.on_chat_start = cl.on_message = lambda fn: fn
+    return cl
+
+
+def load_app(name: str) -> types.ModuleType:
+    path = os.path.join(REPO_DIR, f"{name}.py")
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    try:
+        code = compile(source, path, "exec")
+    except SyntaxError:
+        # chainlit.py opens with a pasted prompt and sample spec; the app proper starts at its imports.
+        start = re.search(r"^(?:import|from) \S+", source, re.M).start()
+        code = compile("\n" * source.count("\n", 0, start) + source[start:], path, "exec")
+    module = types.ModuleType(f"bench_{name}")
+    module.__file__ = path
+    exec(code, module.__dict__)
+    return module
+
+
+# --- Session drivers ---
+
+async def drive_multiplestories(app, prompts):
+    await app.start()
+    for prompt in prompts:
+        await app.prompt_llm(_Message(prompt))
+    await app.prompt_llm(_Message("submit"))
+
+
+async def drive_chainlit(app, prompts):
+    # start() asks for the first prompt itself.
+    await app.start()
+    for prompt in prompts[1:]:
+        await app.on_message(_Message(prompt))
+    await app.on_message(_Message("submit"))
+
+
+async def drive_latest(app, prompts):
+    for prompt in prompts:
+        await app.main(_Message(prompt))
+
+
+async def drive_newchainlit(app, prompts):
+    await app.start()
+    upload = _session_state.get()["upload"]
+    await app.main(_Message("", elements=[_File(upload.name, upload.content, "application/x-yaml")]))
+    for prompt in prompts:
+        await app.main(_Message(prompt))
+
+
+DRIVERS = {
+    "multiplestories": drive_multiplestories,
+    "chainlit": drive_chainlit,
+    "latest": drive_latest,
+    "newchainlit": drive_newchainlit,
+}
+
+
+# --- Workload ---
+
+def synthetic_spec(operations: int = 20) -> dict:
+    paths, schemas = {}, {}
+    for i in range(operations // 2 or 1):
+        name = f"Resource{i}"
+        schemas[name] = {
+            "type": "object",
+            "required": ["id"],
+            "properties": {
+                "id": {"type": "string", "description": f"Identifier of {name}."},
+                "amount": {"type": "number", "minimum": 0.01},
+                "status": {"type": "string", "enum": ["PENDING", "COMPLETED", "FAILED"]},
+            },
+        }
+        ref = {"$ref": f"#/components/schemas/{name}"}
+        paths[f"/resources{i}"] = {
+            "get": {"summary": f"List {name} items", "tags": [f"group{i % 4}"],
+                    "responses": {"200": {"description": "OK", "content": {"application/json": {"schema": ref}}}}},
+            "post": {"summary": f"Create a {name}", "tags": [f"group{i % 4}"],
+                     "requestBody": {"content": {"application/json": {"schema": ref}}},
+                     "responses": {"201": {"description": "Created"}}},
+        }
+    return {
+        "openapi": "3.0.0",
+        "info": {"title": "Benchmark API", "version": "1.0.0"},
+        "paths": paths,
+        "components": {"schemas": schemas},
+    }
+
+
+def load_prompts(path: str) -> list[str]:
+    """
+    Reads a prompt workload: one JSON object per line with a `prompt`, `content`
+    or `title` field (so a backlog file like requests.jsonl replays as-is), a
+    JSON string, or a bare line of text.
+    """
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                item = line
+            if isinstance(item, dict):
+                item = item.get("prompt") or item.get("content") or item.get("title")
+            if isinstance(item, str) and item.strip():
+                prompts.append(item.strip())
+    return prompts
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+async def run_sessions(app_name, stub_url, upload, prompts, sessions, concurrency, prompts_per_session, unique):
+    import http_client
+    import telemetry
+
+    durations, errors = defaultdict(list), defaultdict(int)
+
+    def on_span(record):
+        durations[record["stage"]].append(record["duration"])
+        if record["error"]:
+            errors[record["stage"]] += 1
+
+    telemetry.add_span_listener(on_span)
+    connector = aiohttp.TCPConnector(limit=http_client.POOL_LIMIT, limit_per_host=0,
+                                     keepalive_timeout=http_client.KEEPALIVE_TIMEOUT)
+    timeout = aiohttp.ClientTimeout(total=http_client.TOTAL_TIMEOUT, connect=http_client.CONNECT_TIMEOUT)
+    http_client._session = StubSession(stub_url, aiohttp.ClientSession(connector=connector, timeout=timeout))
+
+    app = load_app(app_name)
+    driver = DRIVERS[app_name]
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = []
+
+    async def session(i):
+        async with semaphore:
+            picked = [prompts[(i * prompts_per_session + j) % len(prompts)] for j in range(prompts_per_session)]
+            if unique:
+                picked = [f"{prompt} (session {i})" for prompt in picked]
+            state = {"data": {"id": f"bench-{i}"}, "upload": upload, "prompts": deque(picked),
+                     "messages": 0, "errors": []}
+            _session_state.set(state)
+            try:
+                with telemetry.span("session", session=f"bench-{i}"):
+                    await driver(app, picked)
+            except Exception as e:
+                failed.append(f"{type(e).__name__}: {e}")
+            else:
+                if state["errors"]:
+                    failed.append(state["errors"][0].splitlines()[0])
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(session(i) for i in range(sessions)))
+    finally:
+        elapsed = time.perf_counter() - started
+        await http_client.close_session()
+
+    return {
+        "app": app_name,
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "prompts_per_session": prompts_per_session,
+        "failed_sessions": len(failed),
+        "failures": sorted(set(failed))[:10],
+        "seconds": elapsed,
+        "sessions_per_second": sessions / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {
+            stage: {
+                "count": len(samples),
+                "errors": errors[stage],
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p95_ms": percentile(samples, 95) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+            }
+            for stage, samples in sorted(durations.items())
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"\n== {report['app']}: {report['sessions']} sessions x {report['prompts_per_session']} prompts, "
+          f"concurrency {report['concurrency']}")
+    print(f"{'stage':<16}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<16}{stats['count']:>8}{stats['errors']:>8}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    print(f"sessions/s: {report['sessions_per_second']:.2f}  wall: {report['seconds']:.1f}s  "
+          f"failed sessions: {report['failed_sessions']}  peak RSS: {report['peak_rss_mb']:.1f} MB")
+    for failure in report["failures"]:
+        print(f"  ! {failure}")
+
+
+def _route_values(values: list[str], parse) -> dict:
+    parsed = {}
+    for value in values:
+        route, _, spec = value.partition("=")
+        if route not in ROUTES or not spec:
+            raise argparse.ArgumentTypeError(f"expected ROUTE=VALUE with ROUTE in {ROUTES}, got {value!r}")
+        parsed[route] = parse(spec)
+    return parsed
+
+
+def _latency(spec: str) -> tuple[float, float]:
+    median, _, p95 = spec.partition(":")
+    return float(median), float(p95 or median)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the Chainlit story apps.")
+    parser.add_argument("--app", choices=APPS + ("all",), default="multiplestories")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--prompts", help="JSONL prompt workload to replay (e.g. requests.jsonl)")
+    parser.add_argument("--prompts-per-session", type=int, default=3)
+    parser.add_argument("--unique", action="store_true", help="make every session's prompts distinct (no cache hits)")
+    parser.add_argument("--spec", help="spec file to upload (default: a synthetic OpenAPI spec)")
+    parser.add_argument("--operations", type=int, default=20, help="operations in the synthetic spec")
+    parser.add_argument("--latency", action="append", default=[], metavar="ROUTE=MEDIAN[:P95]",
+                        help=f"stub latency in ms; routes: {', '.join(ROUTES)}")
+    parser.add_argument("--fail", action="append", default=[], metavar="ROUTE=RATE",
+                        help="fraction of stub calls on ROUTE answered with 503")
+    parser.add_argument("--tokens", type=int, default=120, help="tokens per stub LLM completion")
+    parser.add_argument("--token-delay-ms", type=float, default=10)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--stub-url", help="use an already running stub server")
+    parser.add_argument("--serve-stub", type=int, metavar="PORT", help="only run the stub servers on PORT")
+    parser.add_argument("--json", help="write the report(s) as JSON to this path")
+    args = parser.parse_args(argv)
+    try:
+        args.latency = {**DEFAULT_LATENCY_MS, **_route_values(args.latency, _latency)}
+        args.fail = _route_values(args.fail, float)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = StubConfig(args.latency, args.fail, args.tokens, args.token_delay_ms, seed=args.seed)
+    if args.serve_stub:
+        serve_stub(args.serve_stub, config)
+        return
+
+    stub = None
+    stub_url = args.stub_url
+    if not stub_url:
+        stub, stub_url = start_stub_process(config)
+    try:
+        if args.app == "all":
+            # One process per app, so caches and peak RSS are not shared between them.
+            reports = []
+            for app_name in APPS:
+                with tempfile.NamedTemporaryFile(suffix=".json") as out:
+                    argv_app = [*(sys.argv[1:] if argv is None else argv), "--app", app_name,
+                                "--stub-url", stub_url, "--json", out.name]
+                    subprocess.run([sys.executable, os.path.abspath(__file__), *argv_app], check=True)
+                    with open(out.name, encoding="utf-8") as f:
+                        reports.extend(json.load(f))
+        else:
+            reports = [run_app(args, stub_url)]
+            print_report(reports[0])
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(reports, f, indent=2)
+    finally:
+        if stub is not None:
+            stub.terminate()
+
+
+def run_app(args, stub_url: str) -> dict:
+    # Fresh cache, upload registry, local index and Jira log per run unless the environment
+    # points at existing ones; the metrics port is never opened. The LLM quota
+    # gate is off unless LLM_RATE_PER_SECOND is set, to replay a real quota.
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ.setdefault("CACHE_PATH", os.path.join(workdir, "results.sqlite3"))
+    os.environ.setdefault("UPLOAD_REGISTRY_PATH", os.path.join(workdir, "uploads.sqlite3"))
+    os.environ.setdefault("LOCAL_INDEX_DIR", os.path.join(workdir, "index"))
+    os.environ.setdefault("SESSION_STORE_URL", "sqlite:///" + os.path.join(workdir, "sessions.sqlite3"))
+    os.environ.setdefault("INGEST_JOBS_PATH", os.path.join(workdir, "ingest_jobs.sqlite3"))
+    os.environ.setdefault("INGEST_SPOOL_DIR", os.path.join(workdir, "ingest_spool"))
+    os.environ.setdefault("JIRA_SUBMISSIONS_PATH", os.path.join(workdir, "jira_submissions.sqlite3"))
+    os.environ["METRICS_PORT"] = "0"
+    os.environ.setdefault("LLM_RATE_PER_SECOND", "0")
+    sys.path.insert(0, REPO_DIR)
+    sys.modules["chainlit"] = fake_chainlit()
+
+    if args.spec:
+        with open(args.spec, "rb") as f:
+            upload = _File(os.path.basename(args.spec), f.read(), "application/x-yaml")
+    else:
+        upload = _File("bench_spec.yaml", yaml.safe_dump(synthetic_spec(args.operations)).encode("utf-8"),
+                       "application/x-yaml")
+
+    if args.prompts:
+        prompts = load_prompts(args.prompts)
+    else:
+        from bulk import operation_prompts
+        from ingest import scan_spec
+        _, _, manifest = scan_spec(upload.content, upload.name)
+        prompts = [prompt for _, prompt in operation_prompts(manifest["operations"])]
+    if not prompts:
+        raise SystemExit("no prompts to replay")
+
+    return asyncio.run(run_sessions(
+        args.app, stub_url, upload, prompts, args.sessions, args.concurrency, args.prompts_per_session, args.unique
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark for spec conversion: pure-Python PyYAML + stdlib json versus
+the libyaml C loader + orjson fast path, on small, medium and large specs.
+
+    python bench_convert.py                     # synthetic small/medium/large fixtures
+    python bench_convert.py --spec big.yaml     # add real specs to the run
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import yaml
+
+import converters
+from bench import synthetic_spec
+from ingest import scan_spec
+
+FIXTURE_OPERATIONS = {"small": 20, "medium": 400, "large": 4000}
+
+
+def fixtures(extra_specs: list[str]) -> list[tuple[str, str, bytes]]:
+    specs = []
+    for size, operations in FIXTURE_OPERATIONS.items():
+        spec = synthetic_spec(operations)
+        specs.append((f"{size} yaml", "spec.yaml", yaml.safe_dump(spec).encode("utf-8")))
+        specs.append((f"{size} json", "spec.json", json.dumps(spec).encode("utf-8")))
+    for path in extra_specs:
+        with open(path, "rb") as f:
+            specs.append((os.path.basename(path), os.path.basename(path), f.read()))
+    return specs
+
+
+def convert(source: bytes, filename: str) -> int:
+    # The work done per upload: one scan for the manifest, one pass producing JSONL.
+    scan_spec(source, filename)
+    return sum(len(line) for line in converters.iter_jsonl_lines(source, filename, chunk_specs=True))
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark spec conversion with and without the fast parse path.")
+    parser.add_argument("--spec", action="append", default=[], help="extra spec file to include")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    fast = (converters.SafeLoader, converters.orjson)
+    slow = (yaml.SafeLoader, None)
+    if fast == slow:
+        print("note: neither libyaml nor orjson is available, both columns use the pure-Python path")
+
+    print(f"{'spec':<14}{'size':>10}{'python ms':>12}{'fast ms':>10}{'speedup':>9}")
+    try:
+        for name, filename, source in fixtures(args.spec):
+            results = {}
+            for label, (loader, orjson) in (("python", slow), ("fast", fast)):
+                converters.SafeLoader, converters.orjson = loader, orjson
+                results[label] = timed(lambda: convert(source, filename), args.repeat)
+            print(f"{name:<14}{len(source) / 1024:>8.0f}KB{results['python'] * 1000:>12.1f}"
+                  f"{results['fast'] * 1000:>10.1f}{results['python'] / results['fast']:>8.1f}x")
+    finally:
+        converters.SafeLoader, converters.orjson = fast
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+BULK_RATE_PER_SECOND = float(os.getenv("BULK_RATE_PER_SECOND", "4"))
+
+
+@dataclass
+class StoryResult:
+    key: str
+    prompt: str
+    story: str = ""
+    error: str = ""
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.story) and not self.error
+
+
+class RateLimiter:
+    """
+    Spaces out call starts to at most `rate` per second (0 disables the limit).
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def operation_prompts(operations: dict, by_tag: bool = False) -> list[tuple[str, str]]:
+    """
+    Builds (key, prompt) pairs: one per operation, or one per tag covering all of
+    that tag's operations (untagged operations get their own story).
+    """
+    if not by_tag:
+        return [(op, f"Write a Jira story for the `{op}` endpoint.") for op in operations]
+
+    groups = {}
+    for op, tags in operations.items():
+        for tag in tags or [op]:
+            groups.setdefault(tag, []).append(op)
+    return [
+        (tag, f"Write a Jira story for the `{tag}` feature covering: {', '.join(f'`{op}`' for op in ops)}.")
+        for tag, ops in groups.items()
+    ]
+
+
+async def generate_batch(items: list[tuple[str, str]], generate: Callable[[str], Awaitable[str]],
+                         concurrency: int = BULK_CONCURRENCY, rate: float = BULK_RATE_PER_SECOND,
+                         on_result: Callable[[StoryResult, int, int], Awaitable[None]] | None = None) -> list[StoryResult]:
+    """
+    Runs `generate(prompt)` for every (key, prompt) with at most `concurrency`
+    calls in flight and `rate` starts per second. `on_result(result, done, total)`
+    is awaited as each story completes; results are returned in input order.
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    limiter = RateLimiter(rate)
+    total = len(items)
+    done = 0
+
+    async def run(key, prompt):
+        nonlocal done
+        async with semaphore:
+            await limiter.wait()
+            result = StoryResult(key, prompt)
+            started = time.perf_counter()
+            try:
+                result.story = await generate(prompt)
+            except Exception as e:
+                result.error = str(e) or type(e).__name__
+            result.seconds = time.perf_counter() - started
+        done += 1
+        if on_result is not None:
+            await on_result(result, done, total)
+        return result
+
+    return list(await asyncio.gather(*(run(key, prompt) for key, prompt in items)))
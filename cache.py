@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from singleflight import SingleFlight
+from telemetry import Gauge
+
+CACHE_PATH = os.getenv("CACHE_PATH", ".cache/results.sqlite3")
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(24 * 3600)))
+CACHE_MEMORY_ENTRIES = int(os.getenv("CACHE_MEMORY_ENTRIES", "512"))
+CACHE_DISK_ENTRIES = int(os.getenv("CACHE_DISK_ENTRIES", "10000"))
+
+# Prompts starting with this word skip the cache lookup and overwrite the entry.
+REGENERATE_PREFIX = "regenerate"
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+def make_key(kind: str, use_case_id: str, prompt: str, template: str = "") -> str:
+    """
+    Cache key for a `kind` ("search", "llm", ...) of result.
+
+    Whitespace/case variants of the same prompt share a key; changing the prompt
+    template invalidates previously cached generations.
+    """
+    return f"{kind}:{use_case_id}:{_hash(normalize_prompt(prompt))}:{_hash(template)[:16]}"
+
+
+def split_regenerate(prompt: str) -> tuple[str, bool]:
+    """
+    Strips a leading "regenerate" from `prompt` and reports whether it was present.
+    """
+    head, _, rest = prompt.strip().partition(" ")
+    if head.lower() == REGENERATE_PREFIX and rest.strip():
+        return rest.strip(), True
+    return prompt, False
+
+
+class ResultCache:
+    """
+    Two-tier cache: an in-memory LRU in front of a SQLite table with TTL and
+    size-based eviction (oldest entries are dropped first).
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl: float = CACHE_TTL,
+                 memory_entries: int = CACHE_MEMORY_ENTRIES, disk_entries: int = CACHE_DISK_ENTRIES):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+        self._db.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            row = self._db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] < self.ttl:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self.hits += 1
+                return value
+
+            self._memory.pop(key, None)
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now),
+            )
+            self._db.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.disk_entries,),
+            )
+            self._db.commit()
+
+    def purge_use_case(self, use_case_id: str, kinds=("search", "llm")):
+        """
+        Drops cached `kinds` results of a use case, e.g. after its spec changed in place.
+        """
+        prefixes = [f"{kind}:{use_case_id}:" for kind in kinds]
+        with self._lock:
+            for key in [key for key in self._memory if key.startswith(tuple(prefixes))]:
+                del self._memory[key]
+            for prefix in prefixes:
+                self._db.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            self._db.commit()
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    async def get_or_compute(self, key: str, compute, refresh: bool = False):
+        """
+        Returns the cached value for `key`, awaiting `compute()` on a miss.
+        Concurrent misses for the same key share a single `compute()` call.
+
+        With `refresh`, the lookup is skipped and the new result replaces the entry.
+        """
+        if not refresh:
+            value = self.get(key)
+            if value is not None:
+                return value
+        return await self._flights.do(key, lambda: self._compute(key, compute))
+
+    async def _compute(self, key, compute):
+        value = await compute()
+        if value:
+            self.set(key, value)
+        return value
+
+
+_default_cache = None
+
+
+def get_cache() -> ResultCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
+
+
+def _stat(name):
+    return lambda: _default_cache.stats()[name] if _default_cache is not None else 0
+
+
+Gauge("story_cache_hits", "Result cache hits since start", fn=_stat("hits"))
+Gauge("story_cache_misses", "Result cache misses since start", fn=_stat("misses"))
+Gauge("story_cache_hit_ratio", "Result cache hit ratio since start", fn=_stat("hit_ratio"))
@@ -38,54 +38,103 @@ async def on_message(message: cl.Message):
 
 
 
+import aiohttp
 import chainlit as cl
-import requests
-import json
-import yaml
-import io
 
-# --- Helpers ---
-def convert_to_jsonl(file_bytes, filename):
-    ext = filename.split(".")[-1].lower()
-    if ext in ("yaml", "yml"):
-        data = yaml.safe_load(file_bytes.decode("utf-8"))
-    else:
-        data = json.loads(file_bytes.decode("utf-8"))
-    if isinstance(data, dict):
-        data = [data]
-    jsonl_data = "\n".join(json.dumps(record) for record in data)
-    return io.BytesIO(jsonl_data.encode("utf-8"))
-
-def upload_file(jsonl_file, original_filename):
-    response = requests.post(
-        "https://your-server/upload",
-        files={"file": (original_filename.rsplit(".", 1)[0] + ".jsonl", jsonl_file)},
-    )
-    response.raise_for_status()
-    return response.json().get("file_id")
+import http_client
+import local_index
+from admission import LLMUnavailable, get_llm_gate, queue_notice
+from cache import get_cache, make_key, split_regenerate
+from context_pack import pack_context
+from ingest_jobs import DONE, resume_in_chat, session_job, submit_in_chat, wait_in_chat
+from jira_queue import JiraSubmitter
+from llm_stream import stream_completion, stream_to_message
+from session_store import get_session_store
+from singleflight import SingleFlight
+from telemetry import annotate, span, start_metrics_server, traced
+from upload_registry import UNKNOWN_USE_CASE_STATUSES, get_registry
+
+BACKEND_BASE = "https://your-server"
+
+STORY_TEMPLATE = """
+You are a product owner writing Jira stories in Gherkin format.
+
+Context:
+{context}
+
+Feature: <feature name>
+
+As a <type of user>
+I want to <perform some action>
+So that <I can achieve some goal>
+
+Scenario: <scenario name>
+Given <some context>
+When <some action is carried out>
+Then <this is the expected outcome>
 
-def trigger_ingest(file_id):
-    response = requests.post("https://your-server/ingest", json={"file_id": file_id})
-    response.raise_for_status()
-    return response.json().get("use_case_id")
+Acceptance Criteria:
+- <list of conditions to be met>
+
+Also include:
+- Epic
+- Labels
+- Priority
+- Any subtasks (if applicable)
+
+User Prompt:
+{user_prompt}
+"""
 
-def search_context(prompt, headers):
-    response = requests.post("https://your-server/search", json={"query": prompt}, headers=headers)
-    response.raise_for_status()
-    return response.json().get("context", "")
+jira = JiraSubmitter("https://your-jira-api/create", "https://your-jira-api/create/bulk")
+story_flights = SingleFlight()
+start_metrics_server()
 
-def query_llm(final_prompt, headers):
-    response = requests.post("https://your-apigee-llm-endpoint", json={"prompt": final_prompt}, headers=headers)
-    response.raise_for_status()
-    return response.json().get("output", "")
+# --- Helpers ---
+def session_state():
+    # Kept outside this process so a reconnect to another worker finds the same state.
+    return get_session_store().session(cl.user_session.get("id"))
+
+async def search_context(prompt, headers):
+    use_case_id = headers.get("use-case-id", "")
+
+    async def remote_search():
+        try:
+            data = await http_client.post_json(f"{BACKEND_BASE}/search", {"query": prompt}, headers=headers)
+        except aiohttp.ClientResponseError as e:
+            if e.status in UNKNOWN_USE_CASE_STATUSES:
+                get_registry().invalidate_use_case(BACKEND_BASE, use_case_id)
+            raise
+        return data.get("context", "")
+
+    return await local_index.retrieve_chunks(use_case_id, prompt, remote_search)
+
+def query_llm(final_prompt, headers, on_wait=None):
+    # Yields the story text as the LLM streams it, once the shared LLM quota admits the call.
+    return get_llm_gate().stream(
+        lambda: stream_completion("https://your-apigee-llm-endpoint", {"prompt": final_prompt}, headers=headers),
+        on_wait=on_wait,
+    )
 
-def create_jira_story(story_text, headers):
-    response = requests.post("https://your-jira-api/create", json={"story": story_text}, headers=headers)
-    return response.status_code == 201
+async def create_jira_story(story_text, headers):
+    [result] = await jira.submit([story_text], headers.get("use-case-id", ""), headers=headers)
+    return result.ok
 
 # --- Chainlit App Start ---
 @cl.on_chat_start
+@traced("start")
 async def start():
+    annotate(session=cl.user_session.get("id"))
+    state = session_state()
+    if await resume_in_chat(state, cl.Message, announce_ingest):
+        return
+    # Chainlit reruns this when a session lands on another worker; the store still has its headers.
+    headers = state.get("headers") or apply_ingest(state, session_job(state))
+    if headers:
+        annotate(use_case_id=headers.get("use-case-id", ""))
+        await cl.Message("✅ Welcome back! Your uploaded spec is still loaded; enter your prompt.").send()
+        return
+
     # Step 1: Ask for file
     files = await cl.AskFileMessage(
         content="📎 Upload Swagger or Figma file (JSON/YAML) to begin.",
@@ -93,73 +142,95 @@ async def start():
     ).send()
 
     file = files[0]
-    jsonl_file = convert_to_jsonl(file.content, file.name)
+    # Step 2: Upload and Ingest in the background (only what changed since this spec was last ingested)
+    submit_in_chat(state, BACKEND_BASE, file.content, file.name, cl.Message, announce_ingest)
 
-    # Step 2: Upload and Ingest
-    file_id = upload_file(jsonl_file, file.name)
-    use_case_id = trigger_ingest(file_id)
-    headers = {"use-case-id": use_case_id}
-    cl.user_session.set("headers", headers)
+    # Step 3: Ask for user prompt while the spec is ingested; it runs once indexing finishes
+    prompt = await cl.AskUserMessage("💬 What kind of Jira story do you want to generate? (e.g., 'checkout API for merchants')").send()
 
-    await cl.Message(f"✅ File `{file.name}` uploaded and ingested.").send()
+    headers = apply_ingest(state, await wait_in_chat(state, cl.Message))
+    if headers:
+        await generate_story(prompt.content, headers)
 
-    # Step 3: Ask for user prompt
-    prompt = await cl.AskUserMessage("💬 What kind of Jira story do you want to generate? (e.g., 'checkout API for merchants')").send()
+def apply_ingest(state, job):
+    # Stores a finished job's use case as the session headers; None if it failed.
+    if job is None or job["status"] != DONE:
+        return None
+    headers = {"use-case-id": job["result"]["use_case_id"]}
+    state.set("headers", headers)
+    return headers
 
-    await generate_story(prompt.content, headers)
+def announce_ingest(job):
+    apply_ingest(session_state(), job)
+    annotate(use_case_id=job["result"]["use_case_id"])
+    return f"✅ File `{job['filename']}` {job['result']['summary']}."
 
 # --- Handle user messages ---
 @cl.on_message
 async def on_message(message: cl.Message):
-    headers = cl.user_session.get("headers")
+    state = session_state()
+    headers = state.get("headers") or apply_ingest(state, await wait_in_chat(state, cl.Message))
     if not headers:
         await cl.Message("⚠️ Please upload a file first.").send()
         return
 
     if message.content.strip().lower() == "submit":
-        story = cl.user_session.get("pending_story", "")
-        success = create_jira_story(story, headers)
+        draft = state.get_draft()
+        if not draft:
+            await cl.Message("No story to submit. Please generate one first.").send()
+            return
+        success = await create_jira_story(draft["story"], headers)
         await cl.Message("✅ Jira story created!" if success else "❌ Failed to create Jira story.").send()
     else:
         await generate_story(message.content, headers)
 
 # --- Generate story using prompt + RAG ---
+@traced("generate_story")
 async def generate_story(user_prompt, headers):
-    context = search_context(user_prompt, headers)
-
-    final_prompt = f"""
-You are a product owner writing Jira stories in Gherkin format.
-
-Context:
-{context}
-
-Feature: <feature name>
-
-As a <type of user>
-I want to <perform some action>
-So that <I can achieve some goal>
-
-Scenario: <scenario name>
-Given <some context>
-When <some action is carried out>
-Then <this is the expected outcome>
-
-Acceptance Criteria:
-- <list of conditions to be met>
-
-Also include:
-- Epic
-- Labels
-- Priority
-- Any subtasks (if applicable)
-
-User Prompt:
-{user_prompt}
-"""
-
-    story = query_llm(final_prompt, headers)
-    cl.user_session.set("pending_story", story)
+    cache = get_cache()
+    use_case_id = headers.get("use-case-id", "")
+    annotate(session=cl.user_session.get("id"), use_case_id=use_case_id)
+    user_prompt, regenerate = split_regenerate(user_prompt)
+    msg = cl.Message("📝 **Preview Jira Story:**\n\n")
+    await msg.send()
+    key = make_key("llm", use_case_id, user_prompt, STORY_TEMPLATE)
+
+    async def generate():
+        with span("search"):
+            results = await cache.get_or_compute(
+                make_key("search", use_case_id, user_prompt),
+                lambda: search_context(user_prompt, headers),
+                refresh=regenerate,
+            )
+            context, _ = pack_context(results, STORY_TEMPLATE)
+        parts = []
+        with span("llm"):
+            final_prompt = STORY_TEMPLATE.format(context=context, user_prompt=user_prompt)
+            async for piece in query_llm(final_prompt, headers, on_wait=queue_notice(msg, msg.content)):
+                parts.append(piece)
+                yield piece
+        if "".join(parts):
+            cache.set(key, "".join(parts))
+
+    # Identical prompts in flight from other sessions share one search + LLM stream.
+    story = None if regenerate else cache.get(key)
+    if story is None:
+        try:
+            story = await stream_to_message(msg, story_flights.stream(key, generate))
+        except LLMUnavailable as e:
+            await msg.stream_token(f"🔌 {e}")
+            await msg.update()
+            return
+    else:
+        await msg.stream_token(story)
+    if not story:
+        await msg.stream_token("⚠️ No story generated.")
+        await msg.update()
+        return
+    version = session_state().save_draft(story)
 
-    await cl.Message(
-        f"📝 **Preview Jira Story:**\n\n{story}\n\n✅ Type `submit` to create the Jira ticket or modify your prompt."
-    ).send()
+    await msg.stream_token(
+        f"\n\n✅ Saved as draft v{version}. Type `submit` to create the Jira ticket, modify your prompt, "
+        "or prefix it with `regenerate` for a fresh story."
+    )
+    await msg.update()
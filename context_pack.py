@@ -0,0 +1,137 @@
+import logging
+import os
+import re
+from dataclasses import dataclass
+
+from telemetry import TOKENS
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a word/punctuation estimate
+    _encoding = None
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_WINDOW_TOKENS = int(os.getenv("CONTEXT_WINDOW_TOKENS", "32000"))
+OUTPUT_RESERVE_TOKENS = int(os.getenv("OUTPUT_RESERVE_TOKENS", "2000"))
+# Hard cap on context tokens regardless of how much of the window is free.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 64
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(_TOKEN_RE.findall(text))
+
+
+def as_chunks(results) -> list[dict]:
+    """
+    Normalizes search output into [{"text", "score"}]: accepts a context string
+    (split on blank lines), a list of strings, or a list of documents with
+    optional scores. Unscored chunks keep their retrieval order.
+    """
+    if not results:
+        return []
+    if isinstance(results, str):
+        results = [part for part in re.split(r"\n\s*\n", results) if part.strip()]
+    chunks = []
+    for rank, item in enumerate(results):
+        if isinstance(item, dict):
+            text = item.get("text") or item.get("content") or ""
+            score = item.get("score")
+        else:
+            text, score = str(item), None
+        if text.strip():
+            chunks.append({"text": text, "score": float(score) if score is not None else -rank})
+    return chunks
+
+
+def _minhash(text: str) -> tuple:
+    words = text.lower().split()
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    return tuple(min(hash((seed, shingle)) for shingle in shingles) for seed in range(MINHASH_PERMUTATIONS))
+
+
+def _similarity(a: tuple, b: tuple) -> float:
+    return sum(x == y for x, y in zip(a, b)) / MINHASH_PERMUTATIONS
+
+
+def dedupe(chunks: list[dict], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> list[dict]:
+    """
+    Drops chunks whose estimated shingle Jaccard similarity to a better-scored
+    chunk is at least `threshold`.
+    """
+    kept, signatures = [], []
+    for chunk in sorted(chunks, key=lambda c: c["score"], reverse=True):
+        signature = _minhash(chunk["text"])
+        if any(_similarity(signature, other) >= threshold for other in signatures):
+            continue
+        kept.append(chunk)
+        signatures.append(signature)
+    return kept
+
+
+@dataclass
+class PackStats:
+    budget: int
+    tokens_in: int
+    tokens_out: int
+    chunks_in: int
+    chunks_out: int
+    duplicates: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+
+def context_budget(template: str = "") -> int:
+    free = CONTEXT_WINDOW_TOKENS - count_tokens(template) - OUTPUT_RESERVE_TOKENS
+    return max(min(CONTEXT_TOKEN_BUDGET, free), 0)
+
+
+def pack_context(results, template: str = "", budget: int | None = None) -> tuple[str, PackStats]:
+    """
+    Dedupes and greedily packs the best-scored chunks into the token budget left
+    over by `template` and the output reserve. Returns (context, stats).
+    """
+    budget = context_budget(template) if budget is None else budget
+    chunks = as_chunks(results)
+    for chunk in chunks:
+        chunk["tokens"] = count_tokens(chunk["text"])
+    unique = dedupe(chunks)
+
+    packed, used = [], 0
+    for chunk in unique:
+        if used + chunk["tokens"] <= budget:
+            packed.append(chunk["text"])
+            used += chunk["tokens"]
+    if not packed and unique and budget:
+        # Even the best chunk is too large: keep its proportional prefix.
+        top = unique[0]
+        packed.append(top["text"][:len(top["text"]) * budget // top["tokens"]])
+        used = count_tokens(packed[0])
+
+    stats = PackStats(
+        budget=budget,
+        tokens_in=sum(chunk["tokens"] for chunk in chunks),
+        tokens_out=used,
+        chunks_in=len(chunks),
+        chunks_out=len(packed),
+        duplicates=len(chunks) - len(unique),
+    )
+    TOKENS.inc(stats.tokens_in, kind="context_in")
+    TOKENS.inc(stats.tokens_out, kind="context_out")
+    logger.info(
+        "context packed: %d/%d chunks, %d -> %d tokens (saved %d, %d near-duplicates, budget %d)",
+        stats.chunks_out, stats.chunks_in, stats.tokens_in, stats.tokens_out,
+        stats.tokens_saved, stats.duplicates, stats.budget,
+    )
+    return "\n\n".join(packed), stats
@@ -0,0 +1,151 @@
+import asyncio
+import io
+import json
+import os
+from typing import AsyncIterator, Callable, Iterable, Iterator
+
+import yaml
+
+from figma_pruner import is_figma_export, iter_figma_rows
+from spec_chunker import chunk_record
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json is used instead
+    orjson = None
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Sources at least this large are parsed/converted off the event loop thread.
+OFFLOAD_THRESHOLD_BYTES = int(os.getenv("CONVERT_OFFLOAD_BYTES", str(256 * 1024)))
+
+
+def _as_stream(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+
+def iter_records(source, filename: str, flatten_lists: bool = True) -> Iterator:
+    """
+    Yields one record per YAML document (or per list item) in `source`; with
+    `flatten_lists=False` a top-level list stays one record.
+
+    `source` may be raw bytes or a binary file object. YAML documents are parsed
+    one at a time, so only the current document is ever held in memory. Figma
+    exports are pruned while streaming and yield one row per page, screen and
+    component instead of the whole node tree.
+    """
+    if is_figma_export(source, filename):
+        yield from iter_figma_rows(source, filename)
+        return
+    ext = filename.split(".")[-1].lower()
+    stream = _as_stream(source)
+    if ext in ("yaml", "yml"):
+        documents = yaml.load_all(stream, Loader=SafeLoader)
+    elif orjson is not None:
+        documents = [orjson.loads(stream.read())]
+    else:
+        documents = [json.load(stream)]
+
+    for doc in documents:
+        if doc is None:
+            continue
+        if flatten_lists and isinstance(doc, list):
+            yield from doc
+        else:
+            yield doc
+
+
+def iter_jsonl_lines(source, filename: str, chunk_specs: bool = False,
+                     on_row: Callable[[dict], None] | None = None,
+                     keep: Callable[[dict], bool] | None = None, flatten_lists: bool = True) -> Iterator[bytes]:
+    """
+    Yields newline-terminated, UTF-8 encoded JSONL lines, one per record.
+
+    With `chunk_specs`, OpenAPI/Swagger documents are emitted as one chunk per
+    operation (see spec_chunker) instead of a single record. `on_row` is called
+    with every row, e.g. to build a local index during upload; only rows for
+    which `keep` returns true are emitted. `flatten_lists` is passed on to
+    iter_records.
+    """
+    for record in iter_records(source, filename, flatten_lists):
+        rows = chunk_record(record, filename) if chunk_specs else (record,)
+        for row in rows:
+            if on_row is not None:
+                on_row(row)
+            if keep is not None and not keep(row):
+                continue
+            yield dumps_line(row)
+
+
+def dumps_line(row) -> bytes:
+    """
+    One JSONL line; orjson when installed, stdlib json for anything it rejects
+    (e.g. integers wider than 64 bits).
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(row, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass
+    return json.dumps(row).encode("utf-8") + b"\n"
+
+
+def should_offload(source) -> bool:
+    """
+    True when converting `source` is worth moving to a worker thread; file
+    objects count as large since their size is unknown up front.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source) >= OFFLOAD_THRESHOLD_BYTES
+    return True
+
+
+async def run_conversion(fn: Callable, source, *args):
+    """
+    Calls `fn(source, *args)`, in a worker thread when `source` is large.
+    """
+    if should_offload(source):
+        return await asyncio.to_thread(fn, source, *args)
+    return fn(source, *args)
+
+
+def _iter_blocks(lines: Iterable[bytes], chunk_size: int) -> Iterator[bytes]:
+    buffer = bytearray()
+    for line in lines:
+        buffer += line
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def aiter_chunks(lines: Iterable[bytes], chunk_size: int = UPLOAD_CHUNK_SIZE,
+                       offload: bool = False) -> AsyncIterator[bytes]:
+    """
+    Groups `lines` into ~chunk_size byte blocks for a chunked request body.
+
+    With `offload`, each block is produced in a worker thread, so the parsing
+    and serialization driven by `lines` never runs on the event loop.
+    """
+    blocks = _iter_blocks(lines, chunk_size)
+    if not offload:
+        for block in blocks:
+            yield block
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        block = await loop.run_in_executor(None, next, blocks, None)
+        if block is None:
+            return
+        yield block
+
+
+def jsonl_filename(filename: str) -> str:
+    return filename.rsplit(".", 1)[0] + ".jsonl"
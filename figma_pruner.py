@@ -0,0 +1,260 @@
+import io
+import json
+from typing import Iterator
+
+try:
+    import ijson
+except ImportError:  # ijson is optional; without it the export is loaded whole and walked the same way
+    ijson = None
+
+SNIFF_BYTES = 64 * 1024
+
+# Node fields worth keeping; geometry, fills, strokes, effects and vector data are dropped.
+NODE_FIELDS = ("id", "name", "type", "characters", "componentId", "description", "transitionNodeID")
+# Node types whose ids are kept so prototype links can name their destination.
+LINK_TARGET_TYPES = ("CANVAS", "SECTION", "FRAME", "GROUP", "COMPONENT", "COMPONENT_SET", "INSTANCE")
+ROW_LABELS = {"CANVAS": "Page", "FRAME": "Screen", "COMPONENT": "Component", "COMPONENT_SET": "Component set"}
+# One prototype interaction of a node; its trigger may come before or after its actions.
+REACTION_ITEMS = ("interactions.item", "reactions.item")
+
+
+def _peek(source, size: int = SNIFF_BYTES) -> bytes:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:size])
+    if hasattr(source, "seekable") and source.seekable():
+        position = source.tell()
+        head = source.read(size)
+        source.seek(position)
+        return head.encode("utf-8") if isinstance(head, str) else head
+    return b""
+
+
+def is_figma_export(source, filename: str) -> bool:
+    """
+    Sniffs the start of a JSON upload for a Figma file export (a `document`
+    node tree); YAML and non-seekable streams are never treated as Figma.
+    """
+    if filename.split(".")[-1].lower() in ("yaml", "yml"):
+        return False
+    head = _peek(source)
+    return b'"document"' in head and (b'"DOCUMENT"' in head or b'"CANVAS"' in head)
+
+
+def _events(value, prefix: str = "") -> Iterator[tuple]:
+    # Same (prefix, event, value) stream as ijson.parse, for an already-loaded document.
+    if isinstance(value, dict):
+        yield prefix, "start_map", None
+        for key, item in value.items():
+            yield prefix, "map_key", key
+            yield from _events(item, f"{prefix}.{key}" if prefix else key)
+        yield prefix, "end_map", None
+    elif isinstance(value, list):
+        yield prefix, "start_array", None
+        for item in value:
+            yield from _events(item, f"{prefix}.item" if prefix else "item")
+        yield prefix, "end_array", None
+    elif value is None:
+        yield prefix, "null", None
+    elif isinstance(value, bool):
+        yield prefix, "boolean", value
+    elif isinstance(value, (int, float)):
+        yield prefix, "number", value
+    else:
+        yield prefix, "string", value
+
+
+def _parse(source) -> Iterator[tuple]:
+    stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    if ijson is not None:
+        return ijson.parse(stream)
+    return _events(json.load(stream))
+
+
+class _Node:
+    __slots__ = ("prefix", "parent", "fields", "targets", "reaction",
+                 "texts", "instances", "frames", "links", "children")
+
+    def __init__(self, prefix, parent):
+        self.prefix = prefix
+        self.parent = parent
+        self.fields = {}
+        # (trigger, destination id) of this node's own prototype links
+        self.targets = []
+        # [trigger, destination ids] of the interaction being read
+        self.reaction = None
+        # only filled on row nodes: what was folded into them
+        self.texts, self.instances, self.frames, self.links, self.children = [], [], [], [], []
+
+    @property
+    def type(self) -> str:
+        return self.fields.get("type", "")
+
+    @property
+    def label(self) -> str:
+        return self.fields.get("name") or self.type.title() or "?"
+
+    def is_row(self) -> bool:
+        """
+        Pages, top-level screens and components each become one ingest row;
+        everything nested below them is folded into that row.
+        """
+        if self.type in ("CANVAS", "COMPONENT", "COMPONENT_SET"):
+            return True
+        if self.type != "FRAME" or self.parent is None:
+            return False
+        ancestor = self.parent
+        while ancestor.type == "SECTION":
+            ancestor = ancestor.parent
+        return ancestor.type == "CANVAS"
+
+    def row(self):
+        node = self.parent
+        while node is not None and not node.is_row():
+            node = node.parent
+        return node
+
+    def path(self, stop=None) -> str:
+        names, node = [], self
+        while node is not None and node is not stop and node.type != "DOCUMENT":
+            names.append(node.label)
+            node = node.parent
+        return " / ".join(reversed(names))
+
+
+def iter_figma_rows(source, source_name: str = "") -> Iterator[dict]:
+    """
+    Prunes a Figma file export to one compact row per page, top-level screen
+    and component: the hierarchy path, text content, component instances,
+    nested frames and prototype links. The export is parsed as an event stream
+    (ijson when installed), so the full node tree is never built.
+    """
+    components = {}
+    paths = {}
+    rows = []
+    stack = []
+    file_name = ""
+
+    for prefix, event, value in _parse(source):
+        node = stack[-1] if stack else None
+
+        if event == "start_map" and (prefix == "document" or prefix.endswith(".children.item")):
+            stack.append(_Node(prefix, node))
+            continue
+
+        if event == "end_map" and node is not None and prefix == node.prefix:
+            stack.pop()
+            _close(node, paths, rows)
+            continue
+
+        in_reaction = node is not None and prefix[len(node.prefix) + 1:] in REACTION_ITEMS
+        if event in ("start_map", "end_map") and in_reaction:
+            if event == "start_map":
+                node.reaction = ["", []]
+            else:
+                trigger, destinations = node.reaction
+                node.targets.extend((trigger or "ON_CLICK", destination) for destination in destinations)
+                node.reaction = None
+            continue
+
+        if event not in ("string", "number", "boolean"):
+            continue
+
+        if node is None:
+            parts = prefix.split(".")
+            if prefix == "name":
+                file_name = value
+            elif len(parts) == 3 and parts[0] in ("components", "componentSets") and parts[2] in ("name", "description"):
+                components.setdefault(parts[1], {})[parts[2]] = value
+            continue
+
+        key = prefix[len(node.prefix) + 1:]
+        if key in NODE_FIELDS:
+            node.fields[key] = value
+            if key == "transitionNodeID" and value:
+                node.targets.append(("ON_CLICK", value))
+        elif node.reaction is not None and key.startswith(("interactions.", "reactions.")):
+            if key.endswith(".trigger.type"):
+                node.reaction[0] = value
+            elif key.endswith(".destinationId") and value:
+                node.reaction[1].append(value)
+        elif key.startswith("flowStartingPoints.") and key.endswith(".nodeId"):
+            node.targets.append(("FLOW_START", value))
+
+    for row in rows:
+        yield _render(row, paths, components, file_name, source_name)
+
+
+def _close(node: _Node, paths: dict, rows: list):
+    if node.type in LINK_TARGET_TYPES and node.fields.get("id"):
+        paths[node.fields["id"]] = node.path()
+
+    # The legacy transitionNodeID and an interaction often point at the same destination.
+    targets = list(dict.fromkeys(node.targets))
+    if node.is_row():
+        rows.append(node)
+        node.links[:0] = [(node.label, trigger, destination) for trigger, destination in targets]
+        parent_row = node.row()
+        if parent_row is not None:
+            parent_row.children.append(node.label)
+        return
+
+    row = node.row()
+    if row is None:
+        return
+    where = node.path(row)
+    if node.type == "TEXT" and str(node.fields.get("characters", "")).strip():
+        # Text layers are usually named after their content, so locate them by their parent.
+        row.texts.append((node.parent.path(row), node.fields["characters"]))
+    elif node.type == "INSTANCE":
+        row.instances.append((node.fields.get("componentId"), node.label))
+    elif node.type == "FRAME":
+        row.frames.append(where)
+    row.links.extend((where, trigger, destination) for trigger, destination in targets)
+
+
+def _render(node: _Node, paths: dict, components: dict, file_name: str, source_name: str) -> dict:
+    label = ROW_LABELS.get(node.type, node.type.title())
+    path = node.path()
+    lines = [f"{label}: {path}"]
+    description = node.fields.get("description") or components.get(node.fields.get("id"), {}).get("description")
+    if description:
+        lines.append(f"Description: {description}")
+    if node.children:
+        lines.append("Contains: " + ", ".join(node.children))
+    if node.frames:
+        lines.append("Frames: " + ", ".join(node.frames))
+    used = []
+    for component_id, name in node.instances:
+        name = components.get(component_id, {}).get("name") or name
+        if name not in used:
+            used.append(name)
+    if used:
+        lines.append("Components: " + ", ".join(used))
+    if node.texts:
+        lines.append("Texts:")
+        lines.extend(
+            f"- {where}: {' '.join(str(text).split())}" if where else f"- {' '.join(str(text).split())}"
+            for where, text in node.texts
+        )
+    if node.links:
+        lines.append("Links:")
+        lines.extend(
+            f"- {where} ({trigger}) -> {paths.get(destination, destination)}"
+            for where, trigger, destination in node.links
+        )
+    page = node
+    while page.parent is not None and page.type != "CANVAS":
+        page = page.parent
+    return {
+        "id": f"figma:{node.fields.get('id', path)}",
+        "text": "\n".join(lines),
+        "metadata": {
+            "source": source_name,
+            "file": file_name,
+            "kind": "figma",
+            "type": node.type,
+            "node_id": node.fields.get("id"),
+            "path": path,
+            "page": page.label if page.type == "CANVAS" else "",
+        },
+    }
@@ -0,0 +1,81 @@
+import os
+
+import aiohttp
+from multidict import CIMultiDict
+
+# Connection pool settings shared by every Chainlit handler in this process.
+POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "120"))
+
+_session = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Returns the process-wide pooled session, creating it on first use.
+
+    Must be called from inside a running event loop (i.e. from a Chainlit handler).
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=TOTAL_TIMEOUT, connect=CONNECT_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def post_json(url: str, payload: dict, headers: dict | None = None) -> dict:
+    """
+    POSTs a JSON body and returns the decoded JSON response.
+
+    Raises aiohttp.ClientResponseError on a non-2xx status.
+    """
+    async with get_session().post(url, json=payload, headers=headers) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+
+async def post_file(url: str, filename: str, fileobj, headers: dict | None = None) -> dict:
+    """
+    Uploads a file as multipart form field `file` and returns the decoded JSON response.
+
+    `fileobj` may be bytes, a file object or an async iterator of byte chunks; the
+    latter is sent with chunked transfer encoding and never buffered in full.
+    """
+    form = aiohttp.FormData()
+    form.add_field("file", fileobj, filename=filename)
+    async with get_session().post(url, data=form, headers=headers) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+
+async def post_status(url: str, payload: dict, headers: dict | None = None) -> tuple[int, str]:
+    """
+    POSTs a JSON body and returns (status, body text) without raising on error statuses.
+    """
+    async with get_session().post(url, json=payload, headers=headers) as response:
+        return response.status, await response.text()
+
+
+async def post_response(url: str, payload: dict, headers: dict | None = None) -> tuple[int, str, CIMultiDict]:
+    """
+    Like post_status, but also returns the response headers (e.g. for Retry-After),
+    still looked up case-insensitively.
+    """
+    async with get_session().post(url, json=payload, headers=headers) as response:
+        return response.status, await response.text(), response.headers.copy()
@@ -0,0 +1,164 @@
+import hashlib
+from dataclasses import dataclass, field
+
+import aiohttp
+
+import http_client
+import local_index
+from cache import get_cache
+from converters import aiter_chunks, iter_jsonl_lines, iter_records, jsonl_filename, run_conversion, should_offload
+from spec_chunker import chunk_record
+from spec_diff import SpecDiff, canonical_json, diff_manifests, row_hash, row_id, schema_hashes, spec_key
+from telemetry import span
+from upload_registry import UNKNOWN_USE_CASE_STATUSES, get_registry
+
+
+@dataclass
+class IngestResult:
+    use_case_id: str
+    # reused | unchanged | incremental | full
+    status: str
+    diff: SpecDiff | None = None
+    # operation id ("POST /wires") -> tags, for bulk story generation
+    operations: dict = field(default_factory=dict)
+
+    def describe(self) -> str:
+        if self.status == "reused":
+            return "already ingested; reusing it"
+        if self.status == "unchanged":
+            return "no operations changed since the last ingest"
+        if self.status == "incremental":
+            return f"re-ingested changes only ({self.diff.summary()})"
+        return "uploaded and ingested"
+
+
+def scan_spec(source, filename: str) -> tuple[str, str, dict]:
+    """
+    One parsing pass over the upload returning (content digest, spec key, manifest).
+
+    The manifest maps every ingest row id to its content hash and every schema
+    name to its hash; it is what the next revision is diffed against. It also
+    lists the spec's operations with their tags.
+    """
+    digest = hashlib.sha256()
+    key = None
+    rows, schemas, operations = {}, {}, {}
+    for record in iter_records(source, filename):
+        digest.update(canonical_json(record).encode("utf-8"))
+        digest.update(b"\n")
+        key = key or spec_key(record, filename)
+        schemas.update(schema_hashes(record))
+        for row in chunk_record(record, filename):
+            rows[row_id(row)] = row_hash(row)
+            if isinstance(row, dict) and "method" in row.get("metadata", {}):
+                operations[row["id"]] = row["metadata"].get("tags", [])
+    manifest = {"rows": rows, "schemas": schemas, "operations": operations}
+    return digest.hexdigest(), key or spec_key(None, filename), manifest
+
+
+async def _notify(on_status, status, **info):
+    if on_status is not None:
+        await on_status(status, **info)
+
+
+async def _upload_and_ingest(backend_base, source, filename, changed=None, use_case_id=None, delete_ids=(),
+                             on_status=None, uploaded=None):
+    """
+    Uploads the spec's rows and ingests them; `changed` restricts the upload to
+    those row ids (None uploads everything) and `use_case_id` targets an existing
+    use case instead of creating one.
+
+    `uploaded` maps "full"/"incremental" to a file id an interrupted run already
+    uploaded for this spec; that upload is reused instead of being repeated.
+    """
+    scope = "full" if changed is None else "incremental"
+    index = local_index.LocalIndex() if local_index.RETRIEVAL_MODE != "remote" else None
+    keep = None if changed is None else (lambda row: row_id(row) in changed)
+    # An empty LocalIndex is falsy (it has __len__), hence the explicit None checks.
+    on_row = index.add if index is not None else None
+    lines = iter_jsonl_lines(source, filename, chunk_specs=True, on_row=on_row, keep=keep)
+    file_id = (uploaded or {}).get(scope)
+    if file_id is None and (changed is None or changed):
+        await _notify(on_status, "uploading")
+        with span("upload"):
+            upload_resp = await http_client.post_file(
+                f"{backend_base}/upload",
+                jsonl_filename(filename),
+                aiter_chunks(lines, offload=should_offload(source)),
+            )
+        file_id = upload_resp.get("file_id")
+        await _notify(on_status, "uploaded", scope=scope, file_id=file_id)
+    elif index is not None:
+        # Deletions only, or already uploaded: nothing to upload, but the local index needs every row.
+        async for _ in aiter_chunks(lines, offload=should_offload(source)):
+            pass
+
+    await _notify(on_status, "indexing")
+    payload = {"file_id": file_id}
+    if use_case_id:
+        payload.update({"use_case_id": use_case_id, "delete_ids": sorted(delete_ids)})
+    with span("ingest"):
+        ingest_resp = await http_client.post_json(f"{backend_base}/ingest", payload)
+    use_case_id = ingest_resp.get("use_case_id") or use_case_id
+    if index is not None:
+        local_index.register_index(use_case_id, index)
+    return file_id, use_case_id
+
+
+async def ingest_spec(backend_base: str, source, filename: str, on_status=None, uploaded=None) -> IngestResult:
+    """
+    Uploads and ingests a spec, doing as little backend work as possible:
+
+    - an identical spec (same content digest) reuses its existing use case;
+    - a revision of a previously ingested spec only ships the added/updated
+      rows plus the ids of deleted ones to the existing use case;
+    - anything else is uploaded and ingested in full.
+
+    `on_status(status, **info)` is awaited on "uploading", "uploaded" (with
+    `scope` and `file_id`, worth keeping to resume from) and "indexing";
+    `uploaded` passes those file ids back in when resuming.
+    """
+    registry = get_registry()
+    with span("convert", filename=filename):
+        digest, key, manifest = await run_conversion(scan_spec, source, filename)
+
+    known = registry.lookup(backend_base, digest)
+    if known:
+        return IngestResult(known["use_case_id"], "reused", operations=manifest["operations"])
+
+    previous = registry.last_manifest(backend_base, key)
+    if previous is not None:
+        previous_use_case, previous_manifest = previous
+        diff = diff_manifests(previous_manifest, manifest)
+        if diff.is_empty():
+            registry.record(backend_base, digest, None, previous_use_case, filename)
+            registry.record_manifest(backend_base, key, previous_use_case, manifest)
+            return IngestResult(previous_use_case, "unchanged", diff, manifest["operations"])
+        try:
+            file_id, use_case_id = await _upload_and_ingest(
+                backend_base, source, filename,
+                changed=diff.changed,
+                use_case_id=previous_use_case,
+                delete_ids=diff.deleted,
+                on_status=on_status,
+                uploaded=uploaded,
+            )
+        except aiohttp.ClientResponseError as e:
+            if e.status not in UNKNOWN_USE_CASE_STATUSES:
+                raise
+            registry.invalidate_use_case(backend_base, previous_use_case)
+        else:
+            # The use case now holds this revision only; earlier digests must not reuse
+            # it, and results cached for the old revision are stale.
+            registry.forget_digests(backend_base, use_case_id)
+            get_cache().purge_use_case(use_case_id)
+            registry.record(backend_base, digest, file_id, use_case_id, filename)
+            registry.record_manifest(backend_base, key, use_case_id, manifest)
+            return IngestResult(use_case_id, "incremental", diff, manifest["operations"])
+
+    file_id, use_case_id = await _upload_and_ingest(
+        backend_base, source, filename, on_status=on_status, uploaded=uploaded
+    )
+    registry.record(backend_base, digest, file_id, use_case_id, filename)
+    registry.record_manifest(backend_base, key, use_case_id, manifest)
+    return IngestResult(use_case_id, "full", operations=manifest["operations"])
@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Callable
+
+from ingest import ingest_spec
+
+INGEST_JOBS_PATH = os.getenv("INGEST_JOBS_PATH", ".cache/ingest_jobs.sqlite3")
+# Uploaded specs are kept here until their job finishes, so an interrupted job can resume.
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", ".cache/ingest_spool")
+INGEST_JOB_CONCURRENCY = int(os.getenv("INGEST_JOB_CONCURRENCY", "2"))
+HEARTBEAT_SECONDS = 10.0
+# A running job whose heartbeat is this old lost its worker and may be resumed.
+STALE_SECONDS = 3 * HEARTBEAT_SECONDS
+POLL_SECONDS = 1.0
+# Session field holding the id of the session's latest ingest job.
+SESSION_JOB_FIELD = "ingest_job"
+
+QUEUED, UPLOADING, INDEXING, DONE, FAILED = "queued", "uploading", "indexing", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+_COLUMNS = (
+    "job_id", "session_id", "backend_base", "filename", "digest", "spool_path",
+    "status", "checkpoint", "result", "error", "created", "updated",
+)
+
+
+def status_line(job: dict) -> str:
+    """
+    Chat text for a job that has not finished yet.
+    """
+    name = f"`{job['filename']}`"
+    if job["status"] == QUEUED:
+        return f"⏳ Ingest of {name} is queued (job {job['job_id']})."
+    if job["status"] == UPLOADING:
+        return f"⬆️ Uploading {name} (job {job['job_id']})..."
+    return f"🗂️ Indexing {name} (job {job['job_id']})..."
+
+
+class IngestJobs:
+    """
+    Runs spec ingests as background jobs tracked in a persistent table, so chat
+    start does not block on them and a job cut short by a restart or crash is
+    picked up again instead of starting over.
+
+    A job moves queued -> uploading -> indexing -> done | failed. The upload's
+    file id is checkpointed as soon as the backend returns it, so a resumed job
+    goes straight to indexing. Running jobs heartbeat; one whose heartbeat is
+    older than STALE_SECONDS is claimed by whichever worker resumes it first.
+    """
+
+    def __init__(self, path: str = INGEST_JOBS_PATH, spool_dir: str = INGEST_SPOOL_DIR,
+                 concurrency: int = INGEST_JOB_CONCURRENCY):
+        self.spool_dir = spool_dir
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._changed = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        os.makedirs(spool_dir, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs ("
+            "job_id TEXT PRIMARY KEY, session_id TEXT, backend_base TEXT NOT NULL, filename TEXT NOT NULL, "
+            "digest TEXT NOT NULL, spool_path TEXT NOT NULL, status TEXT NOT NULL, checkpoint TEXT NOT NULL, "
+            "result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_status ON ingest_jobs (status, updated)")
+        self._db.commit()
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM ingest_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        job["checkpoint"] = json.loads(job["checkpoint"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _update(self, job_id, **fields):
+        for name in ("checkpoint", "result"):
+            if name in fields:
+                fields[name] = json.dumps(fields[name])
+        fields["updated"] = time.time()
+        with self._lock:
+            self._db.execute(
+                f"UPDATE ingest_jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE job_id = ?",
+                (*fields.values(), job_id),
+            )
+            self._db.commit()
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def submit(self, session_id: str, backend_base: str, content: bytes, filename: str) -> str:
+        """
+        Queues an ingest of `content` and returns its job id. Uploading the same
+        spec again while an earlier job for it is unfinished joins (and if need
+        be resumes) that job.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT job_id FROM ingest_jobs WHERE digest = ? AND backend_base = ? AND status NOT IN (?, ?) "
+                "ORDER BY created DESC LIMIT 1",
+                (digest, backend_base, *FINISHED),
+            ).fetchone()
+        if row is not None:
+            self.resume(row[0])
+            return row[0]
+
+        job_id = uuid.uuid4().hex[:12]
+        spool_path = os.path.join(self.spool_dir, job_id)
+        with open(spool_path, "wb") as f:
+            f.write(content)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO ingest_jobs (job_id, session_id, backend_base, filename, digest, spool_path, status, "
+                "checkpoint, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, '{}', ?, ?)",
+                (job_id, session_id, backend_base, filename, digest, spool_path, QUEUED, now, now),
+            )
+            self._db.commit()
+        self._start(job_id)
+        return job_id
+
+    def resume(self, job_id: str) -> bool:
+        """
+        Runs an interrupted job in this process. Returns False if it finished or
+        is still running in another worker.
+        """
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return True
+        now = time.time()
+        with self._lock:
+            # The heartbeat check and the claim are one statement, so only one worker wins.
+            claimed = self._db.execute(
+                "UPDATE ingest_jobs SET updated = ? WHERE job_id = ? AND status NOT IN (?, ?) AND updated < ?",
+                (now, job_id, *FINISHED, now - STALE_SECONDS),
+            ).rowcount
+            self._db.commit()
+        if claimed:
+            self._start(job_id)
+        return bool(claimed)
+
+    def resume_interrupted(self) -> list[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id FROM ingest_jobs WHERE status NOT IN (?, ?) AND updated < ?",
+                (*FINISHED, time.time() - STALE_SECONDS),
+            ).fetchall()
+        return [job_id for (job_id,) in rows if self.resume(job_id)]
+
+    def _start(self, job_id):
+        task = asyncio.ensure_future(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            with self._lock:
+                self._db.execute("UPDATE ingest_jobs SET updated = ? WHERE job_id = ?", (time.time(), job_id))
+                self._db.commit()
+
+    async def _run(self, job_id):
+        heartbeat = asyncio.ensure_future(self._heartbeat(job_id))
+        try:
+            async with self._semaphore:
+                job = self.get(job_id)
+                checkpoint = job["checkpoint"]
+
+                async def on_status(status, **info):
+                    if status == "uploaded":
+                        checkpoint[info["scope"]] = info["file_id"]
+                        self._update(job_id, checkpoint=checkpoint)
+                    else:
+                        self._update(job_id, status=status)
+
+                # A checkpointed upload is reused, so a resumed job may go straight to indexing.
+                self._update(job_id, status=INDEXING if checkpoint else UPLOADING)
+                with open(job["spool_path"], "rb") as f:
+                    content = f.read()
+                result = await ingest_spec(
+                    job["backend_base"], content, job["filename"], on_status=on_status, uploaded=checkpoint
+                )
+            self._update(job_id, status=DONE, result={
+                "use_case_id": result.use_case_id,
+                "status": result.status,
+                "summary": result.describe(),
+                "operations": result.operations,
+            })
+        except asyncio.CancelledError:
+            raise  # left unfinished, to be resumed by the next worker
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e) or type(e).__name__)
+        finally:
+            heartbeat.cancel()
+        job = self.get(job_id)
+        if job["status"] in FINISHED and os.path.exists(job["spool_path"]):
+            os.remove(job["spool_path"])
+
+    async def follow(self, job_id: str) -> AsyncIterator[dict]:
+        """
+        Yields the job each time its status changes, ending once it finishes.
+        Jobs run by other workers are polled, and resumed here if their worker dies.
+        """
+        last = None
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job["status"] != last:
+                last = job["status"]
+                yield job
+            if job["status"] in FINISHED:
+                return
+            if job["updated"] < time.time() - STALE_SECONDS:
+                self.resume(job_id)
+            try:
+                await asyncio.wait_for(self._changed.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait(self, job_id: str) -> dict | None:
+        job = self.get(job_id)
+        async for job in self.follow(job_id):
+            pass
+        return job
+
+
+_default_jobs = None
+
+
+def get_ingest_jobs() -> IngestJobs:
+    global _default_jobs
+    if _default_jobs is None:
+        _default_jobs = IngestJobs()
+    return _default_jobs
+
+
+# --- chat sessions ---
+# `state` is a session_store.SessionState, `new_message(text)` builds an unsent
+# chat message (cl.Message) and `on_done(job)` applies a finished job to the
+# session and returns the text announcing it.
+
+
+def session_job(state) -> dict | None:
+    return get_ingest_jobs().get(state.get(SESSION_JOB_FIELD) or "")
+
+
+async def report_in_chat(job_id: str, new_message: Callable, on_done: Callable[[dict], str]):
+    """
+    Pushes the job's status changes into the chat until it finishes.
+    """
+    status_msg = None
+    async for job in get_ingest_jobs().follow(job_id):
+        if job["status"] == DONE:
+            await new_message(on_done(job)).send()
+        elif job["status"] == FAILED:
+            await new_message(
+                f"❌ Ingest of `{job['filename']}` failed: {job['error']}. Please upload the file again."
+            ).send()
+        elif status_msg is None:
+            status_msg = new_message(status_line(job))
+            await status_msg.send()
+        else:
+            await status_msg.update(content=status_line(job))
+
+
+def submit_in_chat(state, backend_base: str, content: bytes, filename: str,
+                   new_message: Callable, on_done: Callable[[dict], str]) -> str:
+    """
+    Starts ingesting an upload for the session and reports on it in the background.
+    """
+    job_id = get_ingest_jobs().submit(state.session_id, backend_base, content, filename)
+    state.set(SESSION_JOB_FIELD, job_id)
+    asyncio.ensure_future(report_in_chat(job_id, new_message, on_done))
+    return job_id
+
+
+async def resume_in_chat(state, new_message: Callable, on_done: Callable[[dict], str]) -> bool:
+    """
+    Picks up the session's unfinished ingest job, e.g. after a reconnect or a
+    worker restart, and reports on it in the background. Returns False if
+    there is none. Other interrupted jobs are resumed along the way.
+    """
+    jobs = get_ingest_jobs()
+    jobs.resume_interrupted()
+    job = session_job(state)
+    if job is None or job["status"] in FINISHED:
+        return False
+    jobs.resume(job["job_id"])
+    await new_message(f"♻️ Resuming ingest of `{job['filename']}` (job {job['job_id']}).").send()
+    asyncio.ensure_future(report_in_chat(job["job_id"], new_message, on_done))
+    return True
+
+
+async def wait_in_chat(state, new_message: Callable) -> dict | None:
+    """
+    Holds a prompt sent while the session's spec is still being ingested until
+    indexing finishes; returns the session's job (None without one).
+    """
+    job = session_job(state)
+    if job is not None and job["status"] not in FINISHED:
+        await new_message(f"⏳ Your prompt is queued until `{job['filename']}` finishes indexing.").send()
+        job = await get_ingest_jobs().wait(job["job_id"])
+    return job
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import aiohttp
+
+import http_client
+from telemetry import traced
+
+JIRA_SUBMISSIONS_PATH = os.getenv("JIRA_SUBMISSIONS_PATH", ".cache/jira_submissions.sqlite3")
+JIRA_BATCH_SIZE = int(os.getenv("JIRA_BATCH_SIZE", "20"))
+JIRA_MAX_RETRIES = int(os.getenv("JIRA_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+RETRYABLE_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+# The bulk endpoint is optional; these mean "not available here", so fall back to one POST per story.
+BULK_UNSUPPORTED_STATUSES = (404, 405, 501)
+
+
+def idempotency_key(use_case_id: str, story: str) -> str:
+    """
+    Deterministic key for a story: resubmitting the same story for the same use
+    case (a retry, a double click, a reconnect) always produces the same key.
+    """
+    normalized = "\n".join(line.rstrip() for line in story.strip().splitlines())
+    return hashlib.sha256(f"{use_case_id}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SubmitResult:
+    idempotency_key: str
+    # created | duplicate | failed
+    status: str
+    detail: str = ""
+    attempts: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("created", "duplicate")
+
+
+class SubmissionLog:
+    """
+    Persistent set of idempotency keys already created in Jira. Unlike the
+    result cache it never expires or evicts entries: forgetting one would let
+    a repeated submit create a second ticket.
+    """
+
+    def __init__(self, path: str = JIRA_SUBMISSIONS_PATH):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jira_submissions ("
+            "idempotency_key TEXT PRIMARY KEY, status TEXT NOT NULL, use_case_id TEXT, created REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def lookup(self, key: str) -> str | None:
+        """
+        Status ("created" or "duplicate") the story with `key` was submitted with, if any.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status FROM jira_submissions WHERE idempotency_key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, key: str, status: str, use_case_id: str = ""):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO jira_submissions (idempotency_key, status, use_case_id, created) "
+                "VALUES (?, ?, ?, ?)",
+                (key, status, use_case_id, time.time()),
+            )
+            self._db.commit()
+
+
+_default_log = None
+
+
+def get_submission_log() -> SubmissionLog:
+    global _default_log
+    if _default_log is None:
+        _default_log = SubmissionLog()
+    return _default_log
+
+
+def _backoff(attempt: int, retry_after: str | None = None) -> float:
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX * 4)
+        except ValueError:
+            pass
+    # "full jitter" exponential backoff
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class JiraSubmitter:
+    """
+    Sends stories to Jira in batches of `batch_size` via `bulk_url`, falling back
+    to `create_url` per story. Every story carries an Idempotency-Key, transient
+    failures (timeouts, connection errors, 429/5xx) are retried with jittered
+    exponential backoff, and successfully created keys are remembered so a
+    repeated submit does not create a second ticket.
+    """
+
+    def __init__(self, create_url: str, bulk_url: str | None = None,
+                 batch_size: int = JIRA_BATCH_SIZE, max_retries: int = JIRA_MAX_RETRIES):
+        self.create_url = create_url
+        self.bulk_url = bulk_url
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+
+    async def _post_with_retry(self, url, payload, headers):
+        """
+        Returns (status, body, attempts); status 0 means every attempt failed in transport.
+        """
+        status, body = 0, ""
+        for attempt in range(self.max_retries + 1):
+            try:
+                status, body, response_headers = await http_client.post_response(url, payload, headers=headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # The request may or may not have reached Jira; the idempotency key makes a retry safe.
+                status, body, response_headers = 0, str(e) or type(e).__name__, {}
+            if status and status not in RETRYABLE_STATUSES:
+                return status, body, attempt + 1
+            if attempt < self.max_retries:
+                await asyncio.sleep(_backoff(attempt, response_headers.get("Retry-After")))
+        return status, body, self.max_retries + 1
+
+    async def _submit_one(self, story, key, headers) -> SubmitResult:
+        status, body, attempts = await self._post_with_retry(
+            self.create_url, {"story": story, "idempotency_key": key}, {**headers, "Idempotency-Key": key}
+        )
+        if status in (200, 201):
+            return SubmitResult(key, "created", body, attempts)
+        if status == 409:
+            return SubmitResult(key, "duplicate", body, attempts)
+        return SubmitResult(key, "failed", f"{status or 'network error'}: {body}", attempts)
+
+    async def _submit_batch(self, batch, headers) -> list[SubmitResult] | None:
+        payload = {"stories": [{"story": story, "idempotency_key": key} for key, story in batch]}
+        status, body, attempts = await self._post_with_retry(self.bulk_url, payload, headers)
+        if status in BULK_UNSUPPORTED_STATUSES:
+            return None
+        if status not in (200, 201, 207):
+            return [SubmitResult(key, "failed", f"{status or 'network error'}: {body}", attempts) for key, _ in batch]
+
+        try:
+            per_story = {item.get("idempotency_key"): item for item in json.loads(body).get("results", [])}
+        except (ValueError, AttributeError):
+            per_story = {}
+        results = []
+        for key, _ in batch:
+            item = per_story.get(key, {})
+            item_status = item.get("status", status)
+            if item_status in (200, 201, "created"):
+                results.append(SubmitResult(key, "created", json.dumps(item), attempts))
+            elif item_status in (409, "duplicate"):
+                results.append(SubmitResult(key, "duplicate", json.dumps(item), attempts))
+            else:
+                results.append(SubmitResult(key, "failed", item.get("error", "no result for story"), attempts))
+        return results
+
+    @traced("jira")
+    async def submit(self, stories: list[str], use_case_id: str = "", headers: dict | None = None) -> list[SubmitResult]:
+        """
+        Submits `stories` and returns one SubmitResult per story, in order.
+        """
+        headers = dict(headers or {})
+        if use_case_id:
+            headers.setdefault("use-case-id", use_case_id)
+        log = get_submission_log()
+        keys = [idempotency_key(use_case_id, story) for story in stories]
+        results = {}
+
+        pending = []
+        for key, story in zip(keys, stories):
+            if key in results:
+                continue
+            if log.lookup(key):
+                results[key] = SubmitResult(key, "duplicate", "already submitted from this app")
+            else:
+                results[key] = None
+                pending.append((key, story))
+
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            batch_results = await self._submit_batch(batch, headers) if self.bulk_url else None
+            if batch_results is None:
+                self.bulk_url = None
+                batch_results = await asyncio.gather(*(self._submit_one(story, key, headers) for key, story in batch))
+            for result in batch_results:
+                results[result.idempotency_key] = result
+                if result.ok:
+                    log.record(result.idempotency_key, result.status, use_case_id)
+
+        return [results[key] for key in keys]
@@ -1,5 +1,14 @@
+import aiohttp
 import chainlit as cl
-import requests
+
+import http_client
+import local_index
+from admission import LLMUnavailable, get_llm_gate, queue_notice
+from cache import get_cache, make_key, split_regenerate
+from context_pack import pack_context
+from llm_stream import LLMHTTPError, stream_completion, stream_to_message
+from singleflight import SingleFlight
+from telemetry import annotate, span, start_metrics_server, traced
 
 # Config - replace with your actual values
 USE_CASE_ID = "your-use-case-id"
@@ -12,41 +21,75 @@ HEADERS = {
     # "Authorization": "Bearer your_token",
 }
 
-def search_context(user_prompt: str) -> str:
+story_flights = SingleFlight()
+start_metrics_server()
+
+async def remote_search(user_prompt: str) -> list:
     payload = {"query": user_prompt}
-    resp = requests.post(SEARCH_API_URL, json=payload, headers=HEADERS)
-    resp.raise_for_status()
-    results = resp.json()
-    contexts = [doc.get("text", "") for doc in results.get("documents", [])]
-    return "\n".join(contexts)
-
-def generate_jira_story(context: str, user_prompt: str) -> str:
-    prompt = (
-        f"Based on the following API specification context:\n{context}\n\n"
-        f"Write a detailed Jira user story in Gherkin format for the request:\n{user_prompt}\n"
-        "Include acceptance criteria, priority, and subtasks."
-    )
+    results = await http_client.post_json(SEARCH_API_URL, payload, headers=HEADERS)
+    return results.get("documents", [])
+
+async def search_context(user_prompt: str) -> list:
+    return await local_index.retrieve_chunks(USE_CASE_ID, user_prompt, lambda: remote_search(user_prompt))
+
+STORY_TEMPLATE = (
+    "Based on the following API specification context:\n{context}\n\n"
+    "Write a detailed Jira user story in Gherkin format for the request:\n{user_prompt}\n"
+    "Include acceptance criteria, priority, and subtasks."
+)
+
+async def generate_jira_story(context: str, user_prompt: str, msg=None) -> str:
+    prompt = STORY_TEMPLATE.format(context=context, user_prompt=user_prompt)
     payload = {"prompt": prompt}
-    resp = requests.post(LLM_API_URL, json=payload, headers=HEADERS)
-    resp.raise_for_status()
-    llm_response = resp.json()
+    gate = get_llm_gate()
+    if msg is not None:
+        # Sessions sending the same prompt at the same time share one LLM stream.
+        chunks = story_flights.stream(
+            make_key("llm", USE_CASE_ID, prompt),
+            lambda: gate.stream(
+                lambda: stream_completion(LLM_API_URL, payload, headers=HEADERS, output_keys=("generated_text", "text", "token")),
+                on_wait=queue_notice(msg, msg.content),
+            ),
+        )
+        return (await stream_to_message(msg, chunks)).strip()
+    llm_response = await gate.call(lambda: http_client.post_json(LLM_API_URL, payload, headers=HEADERS))
     jira_story = llm_response.get("generated_text") or llm_response.get("text") or ""
     return jira_story.strip()
 
 @cl.on_message
-async def main(message: str):
+@traced("main")
+async def main(message: cl.Message):
+    annotate(session=cl.user_session.get("id"), use_case_id=USE_CASE_ID)
+    cache = get_cache()
     await cl.Message("🔎 Searching context...").send()
     try:
-        context = search_context(message)
-        if not context:
-            await cl.Message("⚠️ No relevant context found for your prompt.").send()
-            return
+        message, regenerate = split_regenerate(message.content)
+        story_key = make_key("llm", USE_CASE_ID, message, STORY_TEMPLATE)
+        jira_story = None if regenerate else cache.get(story_key)
+        if jira_story is None:
+            with span("search"):
+                results = await cache.get_or_compute(
+                    make_key("search", USE_CASE_ID, message), lambda: search_context(message), refresh=regenerate
+                )
+                context, _ = pack_context(results, STORY_TEMPLATE)
+            if not context:
+                await cl.Message("⚠️ No relevant context found for your prompt.").send()
+                return
 
-        await cl.Message("🤖 Generating Jira story...").send()
-        jira_story = generate_jira_story(context, message)
+            await cl.Message("🤖 Generating Jira story...").send()
+            msg = cl.Message("📝 Here is your generated Jira story:\n\n")
+            await msg.send()
+            with span("llm"):
+                jira_story = await generate_jira_story(context, message, msg)
+            await msg.update()
+            if jira_story:
+                cache.set(story_key, jira_story)
+            return
 
         await cl.Message(f"📝 Here is your generated Jira story:\n\n{jira_story}").send()
-    except requests.HTTPError as e:
+    except LLMUnavailable as e:
+        await cl.Message(f"🔌 {e}").send()
+    except (aiohttp.ClientResponseError, LLMHTTPError) as e:
         await cl.Message(f"❌ API request failed: {e}").send()
     except Exception as e:
         await cl.Message(f"❌ Unexpected error: {e}").send()
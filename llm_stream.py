@@ -0,0 +1,192 @@
+import functools
+import json
+import time
+from collections import deque
+from typing import AsyncIterator
+
+from multidict import CIMultiDict
+
+import http_client
+from context_pack import count_tokens
+from telemetry import TIME_TO_FIRST_TOKEN, TOKENS
+
+GEMINI_BASE = "https://generativelanguage.googleapis.com/v1beta/models"
+
+# Statuses meaning "this endpoint does not stream"; callers fall back to a normal call.
+STREAMING_UNSUPPORTED_STATUSES = (400, 404, 405, 501)
+
+_ttft_samples = deque(maxlen=1000)
+
+
+class LLMHTTPError(Exception):
+    def __init__(self, status: int, text: str, headers=None):
+        super().__init__(f"{status} - {text}")
+        self.status = status
+        self.text = text
+        # Case-insensitive, as servers differ in how they case e.g. Retry-After.
+        self.headers = CIMultiDict(headers or {})
+
+
+def record_ttft(seconds: float):
+    _ttft_samples.append(seconds)
+    TIME_TO_FIRST_TOKEN.observe(seconds)
+
+
+def _records_ttft(stream):
+    """
+    Records the time from starting `stream` to its first text. Admission
+    control only starts the stream once the call is admitted, so neither
+    queueing nor retrieval before the call is counted.
+    """
+    @functools.wraps(stream)
+    async def wrapper(*args, **kwargs) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        first = True
+        async for piece in stream(*args, **kwargs):
+            if first:
+                record_ttft(time.perf_counter() - started)
+                first = False
+            yield piece
+    return wrapper
+
+
+def ttft_stats() -> dict:
+    """
+    Time-to-first-token over the most recent streamed completions, in seconds.
+    """
+    if not _ttft_samples:
+        return {"count": 0}
+    samples = sorted(_ttft_samples)
+    return {
+        "count": len(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "last": _ttft_samples[-1],
+    }
+
+
+def _extract_text(obj, keys) -> str:
+    if isinstance(obj, str):
+        return obj
+    if not isinstance(obj, dict):
+        return ""
+    for key in keys:
+        value = obj.get(key)
+        if isinstance(value, str) and value:
+            return value
+    return ""
+
+
+def _gemini_text(data) -> str:
+    parts = []
+    for candidate in data.get("candidates", [])[:1]:
+        for part in candidate.get("content", {}).get("parts", []):
+            parts.append(part.get("text", ""))
+    return "".join(parts)
+
+
+async def _iter_lines(response) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in response.content.iter_any():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+
+async def _iter_events(response) -> AsyncIterator:
+    """
+    Yields decoded JSON events from an SSE (`data: ...`) or NDJSON body as they arrive.
+    """
+    async for line in _iter_lines(response):
+        if line.startswith("data:"):
+            line = line[5:].strip()
+        elif line.startswith((":", "event:", "id:", "retry:")):
+            continue
+        if not line or line == "[DONE]":
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield line
+
+
+@_records_ttft
+async def stream_completion(url: str, payload: dict, headers: dict | None = None,
+                            output_keys=("output", "token", "delta", "generated_text", "text")) -> AsyncIterator[str]:
+    """
+    POSTs `payload` with `"stream": true` and yields text as it arrives.
+
+    SSE and NDJSON bodies are parsed incrementally. An endpoint that ignores the
+    flag and answers with plain JSON yields its whole output once; one that
+    rejects it is called again without the flag.
+    """
+    TOKENS.inc(count_tokens(str(payload.get("prompt", ""))), kind="prompt")
+    session = http_client.get_session()
+    stream_headers = {**(headers or {}), "Accept": "text/event-stream, application/x-ndjson, application/json"}
+    async with session.post(url, json={**payload, "stream": True}, headers=stream_headers) as response:
+        if response.status < 400:
+            if response.content_type in ("text/event-stream", "application/x-ndjson", "application/jsonl"):
+                async for event in _iter_events(response):
+                    text = _extract_text(event, output_keys)
+                    if text:
+                        yield text
+            else:
+                text = _extract_text(await response.json(content_type=None), output_keys)
+                if text:
+                    yield text
+            return
+        if response.status not in STREAMING_UNSUPPORTED_STATUSES:
+            raise LLMHTTPError(response.status, await response.text(), response.headers)
+
+    async with session.post(url, json=payload, headers=headers) as response:
+        if response.status >= 400:
+            raise LLMHTTPError(response.status, await response.text(), response.headers)
+        text = _extract_text(await response.json(content_type=None), output_keys)
+        if text:
+            yield text
+
+
+@_records_ttft
+async def stream_gemini(prompt: str, api_key: str, model: str = "gemini-2.0-flash") -> AsyncIterator[str]:
+    """
+    Streams a Gemini completion via `streamGenerateContent?alt=sse`, falling back
+    to `generateContent` when the streaming endpoint is not available.
+    """
+    payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+    headers = {"Content-Type": "application/json"}
+    TOKENS.inc(count_tokens(prompt), kind="prompt")
+    session = http_client.get_session()
+
+    stream_url = f"{GEMINI_BASE}/{model}:streamGenerateContent?alt=sse&key={api_key}"
+    async with session.post(stream_url, json=payload, headers=headers) as response:
+        if response.status == 200:
+            async for event in _iter_events(response):
+                if isinstance(event, dict):
+                    text = _gemini_text(event)
+                    if text:
+                        yield text
+            return
+        if response.status not in STREAMING_UNSUPPORTED_STATUSES:
+            raise LLMHTTPError(response.status, await response.text(), response.headers)
+
+    url = f"{GEMINI_BASE}/{model}:generateContent?key={api_key}"
+    async with session.post(url, json=payload, headers=headers) as response:
+        if response.status != 200:
+            raise LLMHTTPError(response.status, await response.text(), response.headers)
+        yield _gemini_text(await response.json())
+
+
+async def stream_to_message(msg, chunks: AsyncIterator[str]) -> str:
+    """
+    Forwards `chunks` to `msg.stream_token` as they arrive and returns the full text.
+    """
+    parts = []
+    async for piece in chunks:
+        parts.append(piece)
+        await msg.stream_token(piece)
+    text = "".join(parts)
+    TOKENS.inc(count_tokens(text), kind="output")
+    return text
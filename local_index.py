@@ -0,0 +1,138 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Awaitable, Callable
+
+# local | remote | hybrid (local first, remote when the local index has nothing)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "remote").lower()
+INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", ".local_index")
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lower-cased word tokens; camelCase and snake_case identifiers are split.
+    """
+    return [token.lower() for token in _TOKEN_RE.findall(text)]
+
+
+def record_text(record) -> str:
+    if isinstance(record, dict) and isinstance(record.get("text"), str):
+        return record["text"]
+    return json.dumps(record, separators=(",", ":"))
+
+
+class LocalIndex:
+    """
+    In-memory BM25 inverted index over ingested chunks.
+    """
+
+    def __init__(self):
+        self.docs = []
+        self.doc_lengths = []
+        self.postings = {}
+
+    def add(self, record):
+        doc_index = len(self.docs)
+        text = record_text(record)
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, []).append((doc_index, tf))
+        self.docs.append({
+            "id": record.get("id", str(doc_index)) if isinstance(record, dict) else str(doc_index),
+            "text": text,
+            "metadata": record.get("metadata", {}) if isinstance(record, dict) else {},
+        })
+        self.doc_lengths.append(len(tokens))
+
+    def __len__(self):
+        return len(self.docs)
+
+    def search(self, query: str, k: int = TOP_K) -> list[dict]:
+        """
+        Returns the top `k` documents as dicts with `id`, `text`, `metadata` and `score`.
+        """
+        if not self.docs:
+            return []
+        n_docs = len(self.docs)
+        avg_length = sum(self.doc_lengths) / n_docs or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_index, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_index] / avg_length)
+                scores[doc_index] = scores.get(doc_index, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [{**self.docs[i], "score": score} for i, score in ranked if score > 0]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "docs": self.docs,
+                "doc_lengths": self.doc_lengths,
+                "postings": self.postings,
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls()
+        index.docs = data["docs"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = {term: [tuple(p) for p in postings] for term, postings in data["postings"].items()}
+        return index
+
+
+_indexes = {}
+
+
+def index_path(use_case_id: str) -> str:
+    return os.path.join(INDEX_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", use_case_id) + ".json")
+
+
+def register_index(use_case_id: str, index: LocalIndex):
+    """
+    Makes `index` the local index for `use_case_id` and persists it to disk.
+    """
+    _indexes[use_case_id] = index
+    index.save(index_path(use_case_id))
+
+
+def get_index(use_case_id: str) -> LocalIndex | None:
+    if use_case_id not in _indexes:
+        path = index_path(use_case_id)
+        if not os.path.exists(path):
+            return None
+        _indexes[use_case_id] = LocalIndex.load(path)
+    return _indexes[use_case_id]
+
+
+async def retrieve_chunks(use_case_id: str, query: str, remote: Callable[[], Awaitable], k: int = TOP_K):
+    """
+    Returns retrieval results according to RETRIEVAL_MODE: a list of scored hits
+    from the local index, or whatever `remote` returns.
+
+    `remote` is awaited for "remote" mode, and in "hybrid" mode when the local
+    index is missing or returns no hits.
+    """
+    if RETRIEVAL_MODE in ("local", "hybrid") and use_case_id:
+        index = get_index(use_case_id)
+        hits = index.search(query, k) if index is not None else []
+        if hits or RETRIEVAL_MODE == "local":
+            return hits
+    return await remote()
@@ -1,102 +1,204 @@
 # rag_jira_chainlit/app.py
 import chainlit as cl
-import requests
-import json
-import io
-import yaml
+
+from admission import LLMUnavailable, queue_notice
+from bulk import generate_batch, operation_prompts
+from cache import get_cache, split_regenerate
+from ingest_jobs import DONE, resume_in_chat, session_job, submit_in_chat, wait_in_chat
+from jira_queue import JiraSubmitter
+from llm_stream import stream_to_message
+from session_store import get_session_store
+from singleflight import SingleFlight
+from story_steps import build_prompt, complete_story, story_key, stream_story
+from telemetry import annotate, start_metrics_server, traced
 
 BACKEND_BASE = "https://your-server.com"           # Change this
 LLM_API = "https://your-apigee-llm.com/generate"   # Change this
 JIRA_API = "https://your-jira.com/api/create"      # Change this
+JIRA_BULK_API = f"{JIRA_API}/bulk"                 # Optional; single creates are used if it is missing
+
+jira = JiraSubmitter(JIRA_API, JIRA_BULK_API)
+story_flights = SingleFlight()
+start_metrics_server()
 
-def convert_to_jsonl(file_bytes, filename):
-    ext = filename.split(".")[-1].lower()
-    data = yaml.safe_load(file_bytes.decode("utf-8")) if ext in ["yaml", "yml"] else json.loads(file_bytes.decode("utf-8"))
-    if isinstance(data, dict):
-        data = [data]
-    jsonl_str = "\n".join(json.dumps(row) for row in data)
-    return io.BytesIO(jsonl_str.encode("utf-8"))
+def session_state():
+    # Kept outside this process so a reconnect to another worker finds the same state.
+    return get_session_store().session(cl.user_session.get("id"))
 
 @cl.on_chat_start
+@traced("start")
 async def start():
-    cl.user_session.set("use_case_id", "")
+    annotate(session=cl.user_session.get("id"))
+    state = session_state()
+    if await resume_in_chat(state, cl.Message, announce_ingest):
+        return
+    # Chainlit reruns this when a session lands on another worker; the store still has its use case.
+    use_case_id = state.get("use_case_id") or apply_ingest(state, session_job(state))
+    if use_case_id:
+        annotate(use_case_id=use_case_id)
+        await cl.Message(f"✅ Welcome back! Still using use-case ID {use_case_id}. Enter your prompt.").send()
+        return
+
+    state.set("use_case_id", "")
     await cl.Message("📂 Please upload a file to begin.").send()
 
     file_msg = await cl.AskFileMessage("Upload Swagger or Figma JSON/YAML file.", accept=["application/json", ".yaml", ".yml"]).send()
     file = file_msg.files[0]
 
-    jsonl_file = convert_to_jsonl(file.content, file.name)
-
-    upload_resp = requests.post(
-        f"{BACKEND_BASE}/upload",
-        files={"file": (file.name.replace(".yaml", ".jsonl"), jsonl_file)}
+    # Ingest runs in the background; prompts sent meanwhile wait for it in prompt_llm.
+    submit_in_chat(state, BACKEND_BASE, file.content, file.name, cl.Message, announce_ingest)
+    await cl.Message("You can type prompts already; they run as soon as indexing finishes.").send()
+
+def apply_ingest(state, job) -> str:
+    """
+    Stores a finished job's use case in the session and returns its id ("" if it failed).
+    """
+    if job is None or job["status"] != DONE:
+        return ""
+    state.set("use_case_id", job["result"]["use_case_id"])
+    state.set("operations", job["result"]["operations"])
+    return job["result"]["use_case_id"]
+
+def announce_ingest(job) -> str:
+    use_case_id = apply_ingest(session_state(), job)
+    annotate(use_case_id=use_case_id)
+    return (
+        f"✅ File {job['result']['summary']}! Use-case ID: {use_case_id}. Now enter your prompt, "
+        "or type `generate all` (or `generate all by tag`) for a story per endpoint."
     )
-    file_id = upload_resp.json().get("file_id")
 
-    ingest_resp = requests.post(f"{BACKEND_BASE}/ingest", json={"file_id": file_id})
-    use_case_id = ingest_resp.json().get("use_case_id")
+async def write_story(use_case_id, content, regenerate=False, msg=None):
+    """
+    Runs search + LLM for one prompt through the result cache. With `msg`, tokens
+    are streamed into it as they arrive (cached stories arrive in one piece).
+
+    Sessions asking for the same story at the same time share one search + LLM
+    call, and every one of them receives the streamed tokens.
+    """
+    cache = get_cache()
+    key = story_key(use_case_id, content)
+
+    async def generate():
+        final_prompt = await build_prompt(use_case_id, content, BACKEND_BASE, refresh=regenerate)
+        parts = []
+        if msg is None:
+            parts.append(await complete_story(LLM_API, final_prompt, use_case_id))
+            if parts[0]:
+                yield parts[0]
+        else:
+            async for piece in stream_story(LLM_API, final_prompt, use_case_id, on_wait=queue_notice(msg, msg.content)):
+                parts.append(piece)
+                yield piece
+        if "".join(parts):
+            cache.set(key, "".join(parts))
+
+    story = None if regenerate else cache.get(key)
+    if story is not None:
+        if msg is not None:
+            await msg.stream_token(story)
+        return story
+    chunks = story_flights.stream(key, generate)
+    if msg is None:
+        return "".join([piece async for piece in chunks])
+    return await stream_to_message(msg, chunks)
+
+async def generate_all(use_case_id, by_tag=False):
+    state = session_state()
+    operations = state.get("operations") or {}
+    if not operations:
+        await cl.Message("⚠️ No API operations found in the uploaded spec.").send()
+        return
+
+    items = operation_prompts(operations, by_tag)
+    progress = cl.Message(f"⏳ Generating {len(items)} stories...")
+    await progress.send()
 
-    cl.user_session.set("use_case_id", use_case_id)
-    await cl.Message(f"✅ File uploaded and ingested! Use-case ID: {use_case_id}. Now enter your prompt.").send()
+    async def on_result(result, done, total):
+        progress.content = f"⏳ Generated {done}/{total} stories..."
+        await progress.update()
+        body = result.story if result.ok else f"❌ {result.error or 'No story generated.'}"
+        await cl.Message(f"📝 **{result.key}** ({result.seconds:.1f}s)\n\n{body}").send()
+
+    results = await generate_batch(items, lambda prompt: write_story(use_case_id, prompt), on_result=on_result)
+    batch = [{"key": r.key, "story": r.story} for r in results if r.ok]
+    state.set("pending_batch", batch)
+
+    failed = len(results) - len(batch)
+    summary = f"✅ {len(batch)} stories ready for review"
+    if failed:
+        summary += f", {failed} failed"
+    await cl.Message(f"{summary}. Type `submit all` to create them in Jira.").send()
 
 @cl.on_message
+@traced("prompt_llm")
 async def prompt_llm(message: cl.Message):
     content = message.content.strip()
-    use_case_id = cl.user_session.get("use_case_id")
-
-    if content.lower() == "submit":
-        story = cl.user_session.get("pending_story")
-        if not story:
-            await cl.Message("No story to submit. Please generate one first.").send()
+    state = session_state()
+    use_case_id = state.get("use_case_id")
+    annotate(session=cl.user_session.get("id"), use_case_id=use_case_id)
+
+    command, _, version = content.lower().partition(" v")
+    if command == "submit" and (not version or version.isdigit()):
+        draft = state.get_draft(int(version) if version else None)
+        if not draft:
+            missing = f"No draft v{version}." if version else "No story to submit."
+            await cl.Message(f"{missing} Please generate one first.").send()
             return
 
-        jira_resp = requests.post(
-            JIRA_API,
-            json={"story": story},
-            headers={"use-case-id": use_case_id} if use_case_id else {}
-        )
-        if jira_resp.status_code == 201:
+        [result] = await jira.submit([draft["story"]], use_case_id or "")
+        if result.status == "created":
             await cl.Message("Jira story created successfully!").send()
+        elif result.status == "duplicate":
+            await cl.Message("ℹ️ This story was already submitted; no duplicate ticket was created.").send()
         else:
-            await cl.Message(f"❌ Failed to create Jira story.\n{jira_resp.text}").send()
+            await cl.Message(f"❌ Failed to create Jira story.\n{result.detail}").send()
         return
 
+    if content.lower() == "submit all":
+        batch = state.get("pending_batch")
+        if not batch:
+            await cl.Message("No stories to submit. Type `generate all` first.").send()
+            return
+
+        results = await jira.submit([item["story"] for item in batch], use_case_id or "")
+        lines = []
+        for item, result in zip(batch, results):
+            icon = {"created": "✅", "duplicate": "ℹ️"}.get(result.status, "❌")
+            detail = f" — {result.detail}" if result.status == "failed" else ""
+            lines.append(f"{icon} {item['key']}: {result.status}{detail}")
+        failed = [item for item, result in zip(batch, results) if not result.ok]
+        state.set("pending_batch", failed)
+        footer = f"\n\nType `submit all` to retry the {len(failed)} failed stories." if failed else ""
+        await cl.Message("**Jira submission results:**\n" + "\n".join(lines) + footer).send()
+        return
+
+    if not use_case_id:
+        use_case_id = apply_ingest(state, await wait_in_chat(state, cl.Message))
     if not use_case_id:
         await cl.Message("⚠️ No file uploaded and no use-case ID provided. Please upload or configure a use-case ID.").send()
         return
 
-    search_resp = requests.post(
-        f"{BACKEND_BASE}/search",
-        json={"query": content},
-        headers={"use-case-id": use_case_id}
-    )
-    context = search_resp.json().get("context", "")
-
-    final_prompt = f"""
-You are a product owner writing Jira stories in Gherkin format.
-
-Context:
-{context}
-
-Prompt:
-{content}
-
-Write:
-- Title
-- Description
-- Epic
-- Labels
-- Priority
-- Subtasks
-- Gherkin-formatted Acceptance Criteria
-"""
-
-    llm_resp = requests.post(
-        LLM_API,
-        json={"prompt": final_prompt},
-        headers={"use-case-id": use_case_id}
-    )
-    story = llm_resp.json().get("output", "⚠️ No story generated.")
-    cl.user_session.set("pending_story", story)
+    content, regenerate = split_regenerate(content)
+    if content.lower() in ("generate all", "generate all by tag"):
+        await generate_all(use_case_id, by_tag=content.lower().endswith("by tag"))
+        return
+
+    msg = cl.Message("📝 **Preview Jira Story:**\n\n")
+    await msg.send()
+    try:
+        story = await write_story(use_case_id, content, regenerate, msg)
+    except LLMUnavailable as e:
+        await msg.stream_token(f"🔌 {e}")
+        await msg.update()
+        return
+    if not story:
+        await msg.stream_token("⚠️ No story generated. Try rephrasing the prompt.")
+        await msg.update()
+        return
+    version = state.save_draft(story)
 
-    await cl.Message(f"📝 **Preview Jira Story:**\n\n{story}\n\n✅ Type `submit` to create the Jira ticket or enter a new prompt.").send()
+    await msg.stream_token(
+        f"\n\n✅ Saved as draft v{version}. Type `submit` to create the Jira ticket (or `submit v<N>` for an "
+        "earlier draft), enter a new prompt, or prefix it with `regenerate` for a fresh story."
+    )
+    await msg.update()
@@ -1,8 +1,12 @@
 import chainlit as cl
 import yaml
-import json
-import io
-import aiohttp # Required for making async API calls
+
+from admission import LLMUnavailable, get_llm_gate, queue_notice
+from converters import iter_jsonl_lines, run_conversion
+from llm_stream import LLMHTTPError, stream_gemini, stream_to_message
+from telemetry import annotate, start_metrics_server, traced
+
+start_metrics_server()
 
 @cl.on_chat_start
 async def start():
@@ -39,44 +43,35 @@ async def main(message: cl.Message):
     await cl.Message(content="Please send a message or upload a YAML file.").send()
 
 
+@traced("llm")
 async def call_llm(prompt: str):
     """
-    Sends a prompt to the Gemini LLM and streams the response back to the user.
+    Sends a prompt to the Gemini LLM and streams the response back to the user token by token.
     """
     msg = cl.Message(content="")
     await msg.send()
 
     # Gemini API details
     api_key = "" # This will be handled by the execution environment.
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-    
-    payload = {
-        "contents": [{
-            "role": "user",
-            "parts": [{"text": prompt}]
-        }]
-    }
-    
-    headers = {'Content-Type': 'application/json'}
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # Extract the text from the API response
-                    text_response = data['candidates'][0]['content']['parts'][0]['text']
-                    await msg.stream_token(text_response)
-                else:
-                    error_text = await response.text()
-                    await cl.ErrorMessage(content=f"API Error: {response.status} - {error_text}").send()
-
+        # Queued behind other sessions for the shared quota; the message shows the wait meanwhile.
+        chunks = get_llm_gate().stream(lambda: stream_gemini(prompt, api_key), on_wait=queue_notice(msg))
+        await stream_to_message(msg, chunks)
+    except LLMUnavailable as e:
+        await cl.ErrorMessage(content=f"🔌 {e}").send()
+    except LLMHTTPError as e:
+        if e.status == 429:
+            await cl.ErrorMessage(content="The LLM service is busy right now. Please try again in a moment.").send()
+        else:
+            await cl.ErrorMessage(content=f"The LLM service returned an error ({e.status}). Please try again.").send()
     except Exception as e:
         await cl.ErrorMessage(content=f"An unexpected error occurred while contacting the LLM: {e}").send()
     
     await msg.update()
 
 
+@traced("process_file")
 async def process_file(uploaded_file: cl.File):
     """
     Processes the uploaded YAML file and sends back the JSONL result.
@@ -84,13 +79,12 @@ async def process_file(uploaded_file: cl.File):
     Args:
         uploaded_file: The file element uploaded by the user.
     """
+    annotate(session=cl.user_session.get("id"), filename=uploaded_file.name)
     processing_msg = cl.Message(content=f"Processing `{uploaded_file.name}`...")
     await processing_msg.send()
 
     try:
-        file_content = uploaded_file.content.decode("utf-8")
-        jsonl_content, num_documents = convert_yaml_to_jsonl(file_content)
-        jsonl_buffer = io.BytesIO(jsonl_content.encode('utf-8'))
+        jsonl_content, num_documents = await run_conversion(convert_yaml_to_jsonl, uploaded_file.content)
 
         await processing_msg.update(
             content=f"Successfully converted `{uploaded_file.name}` to JSONL. It contains {num_documents} JSON objects."
@@ -99,7 +93,7 @@ async def process_file(uploaded_file: cl.File):
         elements = [
             cl.File(
                 name=f"{uploaded_file.name.split('.')[0]}_converted.jsonl",
-                content=jsonl_buffer.getvalue(),
+                content=jsonl_content,
                 display="inline",
             )
         ]
@@ -115,16 +109,17 @@ async def process_file(uploaded_file: cl.File):
         await cl.ErrorMessage(content=f"An unexpected error occurred: {e}").send()
 
 
-def convert_yaml_to_jsonl(yaml_string: str) -> tuple[str, int]:
+def convert_yaml_to_jsonl(yaml_content: bytes) -> tuple[bytes, int]:
     """
-    Converts a string containing YAML data to a JSONL formatted string.
+    Converts YAML data to JSONL bytes, one line per document (a top-level list
+    stays one line), parsing one document at a time.
     """
-    try:
-        documents = [doc for doc in yaml.safe_load_all(yaml_string) if doc is not None]
-        jsonl_lines = [json.dumps(doc) for doc in documents]
-        return "\n".join(jsonl_lines), len(documents)
-    except yaml.YAMLError as e:
-        raise e
+    buffer = bytearray()
+    num_documents = 0
+    for line in iter_jsonl_lines(yaml_content, "upload.yaml", flatten_lists=False):
+        buffer += line
+        num_documents += 1
+    return bytes(buffer), num_documents
 
 # To run this application:
 # 1. Make sure you have python installed.
@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+# sqlite:///path (default, shared by worker processes on one host) or redis://host:port/db
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "sqlite:///.cache/sessions.sqlite3")
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+
+
+class SessionStore(ABC):
+    """
+    Chat session state kept outside the worker process, so a user who
+    reconnects to another worker (or after a restart) keeps their use case,
+    headers and story drafts.
+
+    Values must be JSON-serializable. Drafts are append-only and numbered from
+    1 per session; `get_draft` without a version returns the latest one.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str, field: str, default=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, session_id: str, field: str, value):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, session_id: str, field: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_draft(self, session_id: str, story: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_draft(self, session_id: str, version: int | None = None) -> dict | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def drafts(self, session_id: str) -> list[dict]:
+        raise NotImplementedError
+
+    def session(self, session_id: str) -> "SessionState":
+        return SessionState(self, session_id)
+
+
+class SessionState:
+    """
+    One session's view of a store, with the same get/set shape as cl.user_session.
+    """
+
+    def __init__(self, store: SessionStore, session_id: str):
+        self.store = store
+        self.session_id = session_id
+
+    def get(self, field: str, default=None):
+        return self.store.get(self.session_id, field, default)
+
+    def set(self, field: str, value):
+        self.store.set(self.session_id, field, value)
+
+    def delete(self, field: str):
+        self.store.delete(self.session_id, field)
+
+    def save_draft(self, story: str) -> int:
+        return self.store.save_draft(self.session_id, story)
+
+    def get_draft(self, version: int | None = None) -> dict | None:
+        return self.store.get_draft(self.session_id, version)
+
+    def drafts(self) -> list[dict]:
+        return self.store.drafts(self.session_id)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite backend; WAL mode lets several worker processes on one host share the file.
+    """
+
+    def __init__(self, path: str, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_state ("
+            "session_id TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (session_id, field))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS drafts ("
+            "session_id TEXT NOT NULL, version INTEGER NOT NULL, story TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (session_id, version))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS session_state_updated ON session_state (updated)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS drafts_created ON drafts (created)")
+        self._db.commit()
+
+    def get(self, session_id, field, default=None):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, updated FROM session_state WHERE session_id = ? AND field = ?", (session_id, field)
+            ).fetchone()
+        if row is None or time.time() - row[1] >= self.ttl:
+            return default
+        return json.loads(row[0])
+
+    def set(self, session_id, field, value):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO session_state (session_id, field, value, updated) VALUES (?, ?, ?, ?)",
+                (session_id, field, json.dumps(value), now),
+            )
+            self._db.execute("DELETE FROM session_state WHERE updated < ?", (now - self.ttl,))
+            self._db.commit()
+
+    def delete(self, session_id, field):
+        with self._lock:
+            self._db.execute("DELETE FROM session_state WHERE session_id = ? AND field = ?", (session_id, field))
+            self._db.commit()
+
+    def save_draft(self, session_id, story):
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE serializes version numbering across processes sharing the file.
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                (version,) = self._db.execute(
+                    "SELECT COALESCE(MAX(version), 0) + 1 FROM drafts WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                self._db.execute(
+                    "INSERT INTO drafts (session_id, version, story, created) VALUES (?, ?, ?, ?)",
+                    (session_id, version, story, now),
+                )
+                self._db.execute("DELETE FROM drafts WHERE created < ?", (now - self.ttl,))
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+        return version
+
+    def get_draft(self, session_id, version=None):
+        with self._lock:
+            if version is None:
+                row = self._db.execute(
+                    "SELECT version, story, created FROM drafts WHERE session_id = ? ORDER BY version DESC LIMIT 1",
+                    (session_id,),
+                ).fetchone()
+            else:
+                row = self._db.execute(
+                    "SELECT version, story, created FROM drafts WHERE session_id = ? AND version = ?",
+                    (session_id, version),
+                ).fetchone()
+        if row is None:
+            return None
+        return {"version": row[0], "story": row[1], "created": row[2]}
+
+    def drafts(self, session_id):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT version, story, created FROM drafts WHERE session_id = ? ORDER BY version", (session_id,)
+            ).fetchall()
+        return [{"version": v, "story": s, "created": c} for v, s, c in rows]
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Redis backend for workers on several hosts. `client` is any redis-py
+    compatible client: state lives in a hash and drafts in a list per session,
+    both expiring `ttl` seconds after the last write.
+    """
+
+    def __init__(self, client, ttl: float = SESSION_TTL, prefix: str = "story"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def _state_key(self, session_id):
+        return f"{self.prefix}:session:{session_id}"
+
+    def _drafts_key(self, session_id):
+        return f"{self.prefix}:drafts:{session_id}"
+
+    def get(self, session_id, field, default=None):
+        raw = self.client.hget(self._state_key(session_id), field)
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, session_id, field, value):
+        key = self._state_key(session_id)
+        self.client.hset(key, field, json.dumps(value))
+        self.client.expire(key, self.ttl)
+
+    def delete(self, session_id, field):
+        self.client.hdel(self._state_key(session_id), field)
+
+    def save_draft(self, session_id, story):
+        key = self._drafts_key(session_id)
+        # RPUSH is atomic and returns the new length, which doubles as the version.
+        version = self.client.rpush(key, json.dumps({"story": story, "created": time.time()}))
+        self.client.expire(key, self.ttl)
+        return version
+
+    def get_draft(self, session_id, version=None):
+        if version is not None and version < 1:
+            return None
+        raw = self.client.lindex(self._drafts_key(session_id), -1 if version is None else version - 1)
+        if raw is None:
+            return None
+        draft = json.loads(raw)
+        if version is None:
+            version = self.client.llen(self._drafts_key(session_id))
+        return {"version": version, **draft}
+
+    def drafts(self, session_id):
+        return [
+            {"version": i, **json.loads(raw)}
+            for i, raw in enumerate(self.client.lrange(self._drafts_key(session_id), 0, -1), 1)
+        ]
+
+
+_default_store = None
+
+
+def get_session_store() -> SessionStore:
+    global _default_store
+    if _default_store is None:
+        if SESSION_STORE_URL.startswith(("redis://", "rediss://")):
+            import redis  # only needed for the Redis backend
+            _default_store = RedisSessionStore(redis.Redis.from_url(SESSION_STORE_URL))
+        else:
+            _default_store = SQLiteSessionStore(SESSION_STORE_URL.removeprefix("sqlite:///"))
+    return _default_store
@@ -0,0 +1,103 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable
+
+from telemetry import Counter
+
+COALESCED_CALLS = Counter("story_coalesced_calls_total", "Calls that joined an identical in-flight call, by kind")
+
+
+def _kind(key: str) -> str:
+    # Keys follow cache.make_key: "<kind>:<use_case_id>:<prompt hash>:..."
+    return key.split(":", 1)[0]
+
+
+class _Broadcast:
+    """
+    Drains one chunk iterator in its own task and replays every chunk, from the
+    first, to each subscriber, so late joiners still receive the whole stream.
+    """
+
+    def __init__(self, chunks: AsyncIterator[str]):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(chunks))
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, chunks):
+        try:
+            async for chunk in chunks:
+                self.chunks.append(chunk)
+                self._wake()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._wake()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        position = 0
+        while True:
+            if position < len(self.chunks):
+                position += 1
+                yield self.chunks[position - 1]
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for `key` is in flight,
+    further callers wait for it instead of starting their own.
+
+    The shared call runs in its own task, so one caller disconnecting does not
+    cancel it for the others. Nothing is kept once it finishes; caching results
+    is left to the caller.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def _start(self, key, flight, task):
+        self._calls[key] = flight
+
+        def finished(_):
+            if self._calls.get(key) is flight:
+                del self._calls[key]
+            if not task.cancelled():
+                task.exception()  # retrieved here so an unawaited failure is not logged as lost
+
+        task.add_done_callback(finished)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        """
+        Returns `await fn()`, sharing one call among concurrent callers with the same key.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._start(key, task, task)
+        else:
+            COALESCED_CALLS.inc(kind=_kind(key))
+        return await asyncio.shield(task)
+
+    def stream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Iterates the chunks of `fn()`, sharing one stream among concurrent callers
+        with the same key; each caller receives every chunk.
+        """
+        broadcast = self._calls.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast(fn())
+            self._start(key, broadcast, broadcast.task)
+        else:
+            COALESCED_CALLS.inc(kind=_kind(key))
+        return broadcast.subscribe()
@@ -0,0 +1,109 @@
+import json
+from typing import Iterator
+
+HTTP_METHODS = ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+
+
+def is_openapi(doc) -> bool:
+    return isinstance(doc, dict) and ("openapi" in doc or "swagger" in doc) and isinstance(doc.get("paths"), dict)
+
+
+def _escape_pointer(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape_pointer(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+class RefResolver:
+    """
+    Inlines local `$ref`s ("#/components/schemas/...", "#/definitions/...").
+
+    Each ref is resolved once and memoized, so a schema shared by many operations
+    is only walked the first time. Recursive schemas are cut off by leaving the
+    innermost `$ref` in place.
+    """
+
+    def __init__(self, spec: dict):
+        self.spec = spec
+        self._resolved = {}
+
+    def lookup(self, ref: str):
+        node = self.spec
+        for token in ref.lstrip("#/").split("/"):
+            node = node[_unescape_pointer(token)]
+        return node
+
+    def resolve(self, node, _stack: tuple = ()):
+        if isinstance(node, list):
+            return [self.resolve(item, _stack) for item in node]
+        if not isinstance(node, dict):
+            return node
+
+        ref = node.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#/"):
+            if ref in _stack:
+                return {"$ref": ref}
+            if ref not in self._resolved:
+                try:
+                    target = self.lookup(ref)
+                except (KeyError, IndexError, TypeError):
+                    return dict(node)
+                self._resolved[ref] = self.resolve(target, _stack + (ref,))
+            return self._resolved[ref]
+
+        return {key: self.resolve(value, _stack) for key, value in node.items()}
+
+
+def _operation_text(method: str, path: str, operation: dict) -> str:
+    lines = [f"{method.upper()} {path}"]
+    for key in ("summary", "description"):
+        if operation.get(key):
+            lines.append(operation[key])
+    lines.append(json.dumps(operation, separators=(",", ":")))
+    return "\n".join(lines)
+
+
+def iter_operation_chunks(spec: dict, source: str = "") -> Iterator[dict]:
+    """
+    Yields one self-contained chunk per path + method with all local refs inlined.
+    """
+    resolver = RefResolver(spec)
+    info = spec.get("info", {})
+    for path, path_item in spec.get("paths", {}).items():
+        if not isinstance(path_item, dict):
+            continue
+        path_item = resolver.resolve(path_item)
+        shared_params = path_item.get("parameters", [])
+        for method in HTTP_METHODS:
+            operation = path_item.get(method)
+            if not isinstance(operation, dict):
+                continue
+            if shared_params:
+                operation = {**operation, "parameters": shared_params + operation.get("parameters", [])}
+            pointer = f"#/paths/{_escape_pointer(path)}/{method}"
+            yield {
+                "id": f"{method.upper()} {path}",
+                "text": _operation_text(method, path, operation),
+                "metadata": {
+                    "source": source,
+                    "pointer": pointer,
+                    "api": info.get("title", ""),
+                    "version": info.get("version", ""),
+                    "path": path,
+                    "method": method.upper(),
+                    "operation_id": operation.get("operationId", ""),
+                    "tags": operation.get("tags", []),
+                },
+            }
+
+
+def chunk_record(record, source: str = "") -> Iterator:
+    """
+    Splits OpenAPI/Swagger documents into operation chunks; passes anything else through.
+    """
+    if is_openapi(record):
+        yield from iter_operation_chunks(record, source)
+    else:
+        yield record
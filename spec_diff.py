@@ -0,0 +1,96 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+
+from spec_chunker import is_openapi
+
+
+def row_id(row) -> str:
+    """
+    Stable identity of an ingested row: the operation id ("POST /wires") for
+    spec chunks, a content hash for anything else.
+    """
+    if isinstance(row, dict) and row.get("id"):
+        return str(row["id"])
+    return "sha256:" + row_hash(row)
+
+
+def _str_keys(value):
+    if isinstance(value, dict):
+        return {str(k): _str_keys(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_str_keys(v) for v in value]
+    return value
+
+
+def canonical_json(value) -> str:
+    """
+    Key-sorted compact JSON for hashing. YAML specs mix int and str keys (e.g.
+    `responses: {200: ..., default: ...}`), which sort_keys cannot compare, so
+    keys are stringified first.
+    """
+    return json.dumps(_str_keys(value), sort_keys=True, separators=(",", ":"))
+
+
+def row_hash(row) -> str:
+    return hashlib.sha256(canonical_json(row).encode("utf-8")).hexdigest()
+
+
+def spec_key(record, filename: str) -> str:
+    """
+    Identity of a spec across revisions: the OpenAPI title together with the
+    file name, else the file name alone. The title by itself is too broad, as
+    unrelated specs often share one ("API", "Swagger Petstore").
+    """
+    stem = filename.rsplit(".", 1)[0]
+    if is_openapi(record) and record.get("info", {}).get("title"):
+        return f"openapi:{record['info']['title']}:{stem}"
+    return "file:" + stem
+
+
+def schema_hashes(record) -> dict:
+    if not is_openapi(record):
+        return {}
+    schemas = record.get("components", {}).get("schemas") or record.get("definitions") or {}
+    return {name: row_hash(schema) for name, schema in schemas.items()}
+
+
+@dataclass
+class SpecDiff:
+    added: set = field(default_factory=set)
+    updated: set = field(default_factory=set)
+    deleted: set = field(default_factory=set)
+    schemas_changed: set = field(default_factory=set)
+
+    @property
+    def changed(self) -> set:
+        return self.added | self.updated
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.updated or self.deleted)
+
+    def summary(self) -> str:
+        text = f"{len(self.added)} added, {len(self.updated)} updated, {len(self.deleted)} deleted"
+        if self.schemas_changed:
+            text += f" (schemas changed: {', '.join(sorted(self.schemas_changed))})"
+        return text
+
+
+def diff_manifests(old: dict, new: dict) -> SpecDiff:
+    """
+    Compares two manifests of the form {"rows": {id: hash}, "schemas": {name: hash}}.
+
+    Schema changes need no separate upload: operations inline their schemas, so
+    every operation using a changed schema shows up in `updated`.
+    """
+    old_rows, new_rows = old.get("rows", {}), new.get("rows", {})
+    old_schemas, new_schemas = old.get("schemas", {}), new.get("schemas", {})
+    return SpecDiff(
+        added={rid for rid in new_rows if rid not in old_rows},
+        updated={rid for rid, h in new_rows.items() if rid in old_rows and old_rows[rid] != h},
+        deleted={rid for rid in old_rows if rid not in new_rows},
+        schemas_changed={
+            name for name in old_schemas.keys() | new_schemas.keys()
+            if old_schemas.get(name) != new_schemas.get(name)
+        },
+    )
@@ -0,0 +1,93 @@
+"""
+The search and LLM steps behind one story, shared by multiplestories.py and
+batch_cli.py. STORY_TEMPLATE is part of the result cache keys, so both import
+this one copy and keep sharing cached stories.
+"""
+from typing import AsyncIterator, Awaitable, Callable
+
+import aiohttp
+
+import http_client
+import local_index
+from admission import BULK, get_llm_gate
+from cache import get_cache, make_key
+from context_pack import pack_context
+from llm_stream import stream_completion
+from telemetry import span
+from upload_registry import UNKNOWN_USE_CASE_STATUSES, get_registry
+
+STORY_TEMPLATE = """
+You are a product owner writing Jira stories in Gherkin format.
+
+Context:
+{context}
+
+Prompt:
+{content}
+
+Write:
+- Title
+- Description
+- Epic
+- Labels
+- Priority
+- Subtasks
+- Gherkin-formatted Acceptance Criteria
+"""
+
+
+def story_key(use_case_id: str, content: str) -> str:
+    return make_key("llm", use_case_id, content, STORY_TEMPLATE)
+
+
+async def search_context(query, use_case_id, backend_base):
+    try:
+        search_resp = await http_client.post_json(
+            f"{backend_base}/search", {"query": query}, headers={"use-case-id": use_case_id}
+        )
+    except aiohttp.ClientResponseError as e:
+        if e.status in UNKNOWN_USE_CASE_STATUSES:
+            get_registry().invalidate_use_case(backend_base, use_case_id)
+        raise
+    return search_resp.get("context", "")
+
+
+async def build_prompt(use_case_id, content, backend_base, refresh=False) -> str:
+    """
+    Retrieves context for `content` through the result cache and fills in STORY_TEMPLATE.
+    """
+    with span("search"):
+        results = await get_cache().get_or_compute(
+            make_key("search", use_case_id, content),
+            lambda: local_index.retrieve_chunks(
+                use_case_id, content, lambda: search_context(content, use_case_id, backend_base)
+            ),
+            refresh=refresh,
+        )
+        context, _ = pack_context(results, STORY_TEMPLATE)
+    return STORY_TEMPLATE.format(context=context, content=content)
+
+
+async def complete_story(llm_api, prompt, use_case_id) -> str:
+    """
+    One non-streaming LLM call; bulk priority, so it queues behind interactive previews.
+    """
+    with span("llm"):
+        llm_resp = await get_llm_gate().call(
+            lambda: http_client.post_json(llm_api, {"prompt": prompt}, headers={"use-case-id": use_case_id}),
+            priority=BULK,
+        )
+    return llm_resp.get("output", "")
+
+
+async def stream_story(llm_api, prompt, use_case_id,
+                       on_wait: Callable[[int, float], Awaitable[None]] | None = None) -> AsyncIterator[str]:
+    """
+    Streams the story text as the LLM produces it, at interactive priority.
+    """
+    with span("llm"):
+        async for piece in get_llm_gate().stream(
+            lambda: stream_completion(llm_api, {"prompt": prompt}, headers={"use-case-id": use_case_id}),
+            on_wait=on_wait,
+        ):
+            yield piece
@@ -0,0 +1,261 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # 0 disables the /metrics endpoint
+TRACE_DUMP_PATH = os.getenv("TRACE_DUMP_PATH", "")     # set to append every span as a JSONL line
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_metrics = []
+_lock = threading.RLock()
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        with _lock:
+            _metrics.append(self)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        return self._header() + [f"{self.name}{_format_labels(k)} {v}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """
+    Settable gauge; with `fn`, the value is read from `fn()` at scrape time instead.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn=None):
+        super().__init__(name, help_text)
+        self.fn = fn
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def render(self) -> list[str]:
+        if self.fn is not None:
+            try:
+                return self._header() + [f"{self.name} {float(self.fn())}"]
+            except Exception:
+                return self._header()
+        return self._header() + [f"{self.name}{_format_labels(k)} {v}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, (counts, total, count) in self._values.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    with _lock:
+        return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
+
+
+STAGE_LATENCY = Histogram("story_stage_latency_seconds", "Latency of each pipeline stage")
+STAGE_ERRORS = Counter("story_stage_errors_total", "Pipeline stage failures")
+STAGE_IN_FLIGHT = Gauge("story_stage_in_flight", "Pipeline stages currently running")
+TOKENS = Counter("story_tokens_total", "Token counts by kind (prompt, output, context_in, context_out)")
+TIME_TO_FIRST_TOKEN = Histogram("story_llm_time_to_first_token_seconds", "Delay from LLM request to first token")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_listeners = []
+
+
+def add_span_listener(fn):
+    """
+    Calls `fn(record)` with every finished span; `record` is the dict that would
+    be written to TRACE_DUMP_PATH.
+    """
+    _span_listeners.append(fn)
+
+
+class span:
+    """
+    Times a pipeline stage (`with span("search", use_case_id=...)` or `async with`).
+
+    Records latency, errors and in-flight counts per stage; attributes such as
+    session and use_case_id only go to the JSONL trace dump, so they never blow
+    up metric cardinality.
+    """
+
+    def __init__(self, stage: str, **attrs):
+        self.stage = stage
+        self.attrs = {k: v for k, v in attrs.items() if v is not None}
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+        if parent is not None:
+            self.attrs = {**parent.attrs, **self.attrs}
+        self._token = _current_span.set(self)
+        self._started_wall = time.time()
+        self._started = time.perf_counter()
+        STAGE_IN_FLIGHT.inc(stage=self.stage)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        STAGE_IN_FLIGHT.dec(stage=self.stage)
+        STAGE_LATENCY.observe(duration, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage, error=exc_type.__name__)
+        _current_span.reset(self._token)
+        if TRACE_DUMP_PATH or _span_listeners:
+            record = {
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "stage": self.stage,
+                "start": self._started_wall,
+                "duration": duration,
+                "attrs": self.attrs,
+                "error": repr(exc) if exc is not None else None,
+            }
+            if TRACE_DUMP_PATH:
+                _dump(record)
+            for listener in _span_listeners:
+                listener(record)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def annotate(**attrs):
+    """
+    Adds attributes (session, use_case_id, ...) to the innermost running span.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.attrs.update({k: v for k, v in attrs.items() if v is not None})
+
+
+def traced(stage: str):
+    """
+    Decorator form of `span` for sync and async functions.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_dump_lock = threading.Lock()
+
+
+def _dump(record: dict):
+    with _dump_lock, open(TRACE_DUMP_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """
+    Serves /metrics on 127.0.0.1:`port` from a daemon thread (once per process).
+    """
+    global _server
+    if _server is not None or not port:
+        return
+    try:
+        _server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    except OSError as e:
+        logger.warning("metrics endpoint not started on port %s: %s", port, e)
+        return
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
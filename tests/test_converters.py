@@ -0,0 +1,22 @@
+import json
+
+from converters import iter_jsonl_lines
+
+DOCUMENTS = b"""\
+- name: a
+- name: b
+---
+name: c
+"""
+
+
+def _rows(**kwargs):
+    return [json.loads(line) for line in iter_jsonl_lines(DOCUMENTS, "upload.yaml", **kwargs)]
+
+
+def test_top_level_lists_are_flattened_by_default():
+    assert _rows() == [{"name": "a"}, {"name": "b"}, {"name": "c"}]
+
+
+def test_one_line_per_document_without_flattening():
+    assert _rows(flatten_lists=False) == [[{"name": "a"}, {"name": "b"}], {"name": "c"}]
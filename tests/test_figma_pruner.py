@@ -0,0 +1,61 @@
+import json
+
+import figma_pruner
+from figma_pruner import iter_figma_rows
+
+
+def _button(node_id, name, reactions):
+    return {"id": node_id, "name": name, "type": "INSTANCE", "reactions": reactions}
+
+
+# Key order as in real exports: a reaction's "action"/"actions" come before its "trigger".
+EXPORT = {
+    "name": "Checkout",
+    "document": {
+        "id": "0:0",
+        "type": "DOCUMENT",
+        "children": [{
+            "id": "0:1",
+            "name": "Flows",
+            "type": "CANVAS",
+            "children": [
+                {"id": "1:1", "name": "Cart", "type": "FRAME", "children": [
+                    _button("1:2", "Pay", [
+                        {"action": {"type": "NODE", "destinationId": "2:1", "navigation": "NAVIGATE"},
+                         "actions": [{"type": "NODE", "destinationId": "2:1", "navigation": "NAVIGATE"}],
+                         "trigger": {"type": "ON_CLICK"}},
+                        {"action": {"type": "NODE", "destinationId": "3:1", "navigation": "OVERLAY"},
+                         "trigger": {"type": "ON_HOVER"}},
+                    ]),
+                    _button("1:3", "Help", [
+                        {"actions": [{"type": "NODE", "destinationId": "3:1"}], "trigger": {"type": "ON_PRESS"}},
+                    ]),
+                ]},
+                {"id": "2:1", "name": "Payment", "type": "FRAME", "children": []},
+                {"id": "3:1", "name": "Tooltip", "type": "FRAME", "children": []},
+            ],
+        }],
+    },
+}
+
+
+def _links(rows, name):
+    text = next(row["text"] for row in rows if row["metadata"]["path"] == f"Flows / {name}")
+    return text.split("Links:\n", 1)[1].splitlines()
+
+
+def test_triggers_stay_with_their_own_destinations():
+    rows = list(iter_figma_rows(json.dumps(EXPORT).encode()))
+
+    assert _links(rows, "Cart") == [
+        "- Pay (ON_CLICK) -> Flows / Payment",
+        "- Pay (ON_HOVER) -> Flows / Tooltip",
+        "- Help (ON_PRESS) -> Flows / Tooltip",
+    ]
+
+
+def test_fallback_parser_matches_ijson(monkeypatch):
+    expected = list(iter_figma_rows(json.dumps(EXPORT).encode()))
+    monkeypatch.setattr(figma_pruner, "ijson", None)
+
+    assert list(iter_figma_rows(json.dumps(EXPORT).encode())) == expected
@@ -0,0 +1,49 @@
+import asyncio
+
+import http_client
+import local_index
+import upload_registry
+from ingest import ingest_spec
+
+SPEC = b"""\
+openapi: 3.0.0
+info:
+  title: Wires
+  version: "1"
+paths:
+  /wires:
+    post:
+      summary: Create a wire transfer
+      responses:
+        201:
+          description: created
+  /accounts:
+    get:
+      summary: List accounts
+      responses:
+        200:
+          description: ok
+"""
+
+
+def test_ingested_spec_is_searchable_locally(tmp_path, monkeypatch):
+    async def post_file(url, filename, chunks):
+        async for _ in chunks:
+            pass
+        return {"file_id": "f1"}
+
+    async def post_json(url, payload, headers=None):
+        return {"use_case_id": "u1"}
+
+    monkeypatch.setattr(http_client, "post_file", post_file)
+    monkeypatch.setattr(http_client, "post_json", post_json)
+    monkeypatch.setattr(local_index, "RETRIEVAL_MODE", "local")
+    monkeypatch.setattr(local_index, "INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(local_index, "_indexes", {})
+    monkeypatch.setattr(upload_registry, "_default_registry", upload_registry.UploadRegistry(str(tmp_path / "uploads.sqlite3")))
+
+    result = asyncio.run(ingest_spec("http://backend", SPEC, "wires.yaml"))
+
+    assert result.use_case_id == "u1"
+    hits = asyncio.run(local_index.retrieve_chunks("u1", "wire transfer", remote=None))
+    assert hits and hits[0]["id"] == "POST /wires"
@@ -0,0 +1,27 @@
+from ingest import scan_spec
+from spec_diff import row_hash
+
+MIXED_KEYS_SPEC = b"""\
+openapi: 3.0.0
+info:
+  title: Wires
+  version: "1"
+paths:
+  /wires:
+    get:
+      responses:
+        200:
+          description: ok
+        default:
+          description: error
+"""
+
+
+def test_scan_spec_handles_int_and_str_keys():
+    digest, key, manifest = scan_spec(MIXED_KEYS_SPEC, "wires.yaml")
+    assert digest
+    assert manifest["rows"]
+
+
+def test_row_hash_is_stable_for_mixed_keys():
+    assert row_hash({200: "ok", "default": "error"}) == row_hash({"default": "error", 200: "ok"})
@@ -0,0 +1,32 @@
+import sqlite3
+
+from upload_registry import UploadRegistry
+
+
+def test_entries_are_scoped_to_their_backend(tmp_path):
+    registry = UploadRegistry(str(tmp_path / "uploads.sqlite3"))
+    registry.record("https://staging", "d1", "f1", "uc-1", "spec.yaml")
+    registry.record_manifest("https://staging", "Wires@spec", "uc-1", {"operations": {}})
+
+    assert registry.lookup("https://staging", "d1")["use_case_id"] == "uc-1"
+    assert registry.lookup("https://prod", "d1") is None
+    assert registry.last_manifest("https://prod", "Wires@spec") is None
+
+    registry.invalidate_use_case("https://prod", "uc-1")
+    assert registry.lookup("https://staging", "d1") is not None
+
+
+def test_registry_without_backends_is_reset(tmp_path):
+    path = str(tmp_path / "uploads.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE uploads (digest TEXT PRIMARY KEY, file_id TEXT, use_case_id TEXT NOT NULL, "
+               "filename TEXT, created REAL NOT NULL)")
+    db.execute("INSERT INTO uploads VALUES ('d1', 'f1', 'uc-1', 'spec.yaml', 0)")
+    db.commit()
+    db.close()
+
+    registry = UploadRegistry(path)
+
+    assert registry.lookup("https://staging", "d1") is None
+    registry.record("https://staging", "d1", "f1", "uc-1")
+    assert registry.lookup("https://staging", "d1")["file_id"] == "f1"
@@ -1,20 +1,43 @@
-import requests
+import asyncio
+import threading
 import time
 
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from telemetry import span
+
+REFRESH_SKEW_SECONDS = 60        # token is treated as expired this long before expiry
+PROACTIVE_REFRESH_SECONDS = 120  # background renewal starts this long before expiry
+MIN_RENEWAL_DELAY_SECONDS = 5    # background renewal never runs more often than this
+
+
 class OAuthClient:
-    def __init__(self, client_id, client_secret, token_url, refresh_token):
+    def __init__(self, client_id, client_secret, token_url, refresh_token, pool_maxsize=20):
         self.client_id = client_id
         self.client_secret = client_secret
         self.token_url = token_url
         self.refresh_token = refresh_token
         self.access_token = None
         self.expiry_time = 0  # Unix timestamp (seconds)
+        self.renewal_time = 0  # background renewal is due from here on
+
+        # One pooled, keep-alive session shared by every request made through this client.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Single-flight refresh: only the thread holding this lock talks to the token endpoint.
+        self._refresh_lock = threading.Lock()
+        self._renewal_timer = None
+        self._closed = False
 
     def is_token_expired(self):
         return time.time() >= self.expiry_time
 
-    def refresh_access_token(self):
-        print("🔄 Refreshing access token...")
+    def _token_request(self):
         payload = {
             "grant_type": "refresh_token",
             "refresh_token": self.refresh_token,
@@ -25,16 +48,85 @@ class OAuthClient:
         headers = {
             "Content-Type": "application/x-www-form-urlencoded"
         }
+        return payload, headers
 
-        response = requests.post(self.token_url, data=payload, headers=headers)
-        if response.status_code == 200:
-            token_data = response.json()
-            self.access_token = token_data["access_token"]
-            expires_in = token_data.get("expires_in", 3600)  # default to 1 hour
-            self.expiry_time = time.time() + expires_in - 60  # refresh 1 min before expiry
-            print("✅ Token refreshed successfully.")
-        else:
-            raise Exception(f"❌ Token refresh failed: {response.status_code} {response.text}")
+    def _store_token(self, token_data):
+        self.access_token = token_data["access_token"]
+        # Some providers rotate the refresh token on every use.
+        self.refresh_token = token_data.get("refresh_token", self.refresh_token)
+        expires_in = token_data.get("expires_in", 3600)  # default to 1 hour
+        self.expiry_time = time.time() + expires_in - REFRESH_SKEW_SECONDS  # refresh 1 min before expiry
+        self._schedule_renewal(expires_in)
+        print("✅ Token refreshed successfully.")
+
+    def _schedule_renewal(self, expires_in):
+        """
+        Renews the token in a daemon thread shortly before the skew window starts,
+        so request threads normally never wait on a refresh.
+        """
+        if self._closed:
+            return
+        if self._renewal_timer is not None:
+            self._renewal_timer.cancel()
+        delay = self._renewal_delay(expires_in)
+        if delay is None:
+            return
+        self._renewal_timer = threading.Timer(delay, self._background_refresh)
+        self._renewal_timer.daemon = True
+        self._renewal_timer.start()
+
+    def _renewal_delay(self, expires_in):
+        """
+        Seconds until background renewal, or None for tokens that only live
+        through the skew window (request threads refresh those on use).
+        Short-lived tokens renew halfway through their usable lifetime.
+        """
+        if expires_in <= REFRESH_SKEW_SECONDS:
+            self.renewal_time = self.expiry_time
+            return None
+        delay = max(
+            expires_in - PROACTIVE_REFRESH_SECONDS,
+            (expires_in - REFRESH_SKEW_SECONDS) / 2,
+            MIN_RENEWAL_DELAY_SECONDS,
+        )
+        self.renewal_time = time.time() + delay
+        return delay
+
+    def is_renewal_due(self):
+        return time.time() >= self.renewal_time
+
+    def _background_refresh(self):
+        try:
+            self.refresh_access_token(renewal=True)
+        except Exception as e:
+            # Request threads will retry synchronously once the token actually expires.
+            print(f"❗ Background token refresh failed: {e}")
+
+    def refresh_access_token(self, force=False, stale_token=None, renewal=False):
+        """
+        Refreshes the token unless another caller already did while we waited for
+        the lock. With `force`, refreshes unless the current token differs from
+        `stale_token` (the one that was rejected). With `renewal`, refreshes only
+        once the token's background renewal is due.
+        """
+        with self._refresh_lock:
+            if force:
+                if stale_token is not None and self.access_token != stale_token:
+                    return
+            elif renewal:
+                if self.access_token is not None and not self.is_renewal_due():
+                    return
+            elif self.access_token is not None and not self.is_token_expired():
+                return
+
+            print("🔄 Refreshing access token...")
+            payload, headers = self._token_request()
+            with span("oauth_refresh"):
+                response = self.session.post(self.token_url, data=payload, headers=headers)
+            if response.status_code == 200:
+                self._store_token(response.json())
+            else:
+                raise Exception(f"❌ Token refresh failed: {response.status_code} {response.text}")
 
     def get_access_token(self):
         if self.access_token is None or self.is_token_expired():
@@ -42,12 +134,103 @@ class OAuthClient:
         return self.access_token
 
     def make_authenticated_request(self, method, url, **kwargs):
+        headers = dict(kwargs.pop("headers", {}))
         token = self.get_access_token()
-        headers = kwargs.pop("headers", {})
         headers["Authorization"] = f"Bearer {token}"
-        response = requests.request(method, url, headers=headers, **kwargs)
+        response = self.session.request(method, url, headers=headers, **kwargs)
+        if response.status_code == 401:
+            # The token was revoked or expired early: refresh once and retry.
+            self.refresh_access_token(force=True, stale_token=token)
+            headers["Authorization"] = f"Bearer {self.access_token}"
+            response = self.session.request(method, url, headers=headers, **kwargs)
         return response
 
+    def close(self):
+        self._closed = True
+        if self._renewal_timer is not None:
+            self._renewal_timer.cancel()
+        self.session.close()
+
+
+class AsyncOAuthClient(OAuthClient):
+    """
+    asyncio variant: concurrent coroutines share one in-flight refresh and one
+    pooled aiohttp session. Use `await get_access_token_async()` and
+    `await make_authenticated_request_async(...)` from async code.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._async_session = None
+        self._refresh_task = None
+
+    def _get_async_session(self):
+        if self._async_session is None or self._async_session.closed:
+            self._async_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=20))
+        return self._async_session
+
+    async def _do_refresh_async(self):
+        print("🔄 Refreshing access token...")
+        payload, headers = self._token_request()
+        async with span("oauth_refresh"), self._get_async_session().post(self.token_url, data=payload, headers=headers) as response:
+            if response.status != 200:
+                raise Exception(f"❌ Token refresh failed: {response.status} {await response.text()}")
+            token_data = await response.json(content_type=None)
+        self._store_token(token_data)
+
+    async def refresh_access_token_async(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._do_refresh_async())
+        # shield: one cancelled waiter must not cancel the refresh the others wait on
+        await asyncio.shield(self._refresh_task)
+
+    def _schedule_renewal(self, expires_in):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return super()._schedule_renewal(expires_in)
+        if self._closed:
+            return
+        if self._renewal_timer is not None:
+            self._renewal_timer.cancel()
+        delay = self._renewal_delay(expires_in)
+        if delay is None:
+            return
+        self._renewal_timer = loop.call_later(delay, lambda: asyncio.ensure_future(self._background_refresh_async()))
+
+    async def _background_refresh_async(self):
+        if self.access_token is not None and not self.is_renewal_due():
+            return  # already renewed by a request coroutine
+        try:
+            await self.refresh_access_token_async()
+        except Exception as e:
+            print(f"❗ Background token refresh failed: {e}")
+
+    async def get_access_token_async(self):
+        if self.access_token is None or self.is_token_expired():
+            await self.refresh_access_token_async()
+        return self.access_token
+
+    async def make_authenticated_request_async(self, method, url, **kwargs):
+        """
+        Returns (status, body text); retries once with a fresh token on a 401.
+        """
+        headers = dict(kwargs.pop("headers", {}))
+        token = await self.get_access_token_async()
+        for attempt in range(2):
+            headers["Authorization"] = f"Bearer {token}"
+            async with self._get_async_session().request(method, url, headers=headers, **kwargs) as response:
+                if response.status != 401 or attempt == 1:
+                    return response.status, await response.text()
+            if self.access_token == token:
+                await self.refresh_access_token_async()
+            token = self.access_token
+
+    async def aclose(self):
+        self.close()
+        if self._async_session is not None:
+            await self._async_session.close()
+
 
 # -----------------------------
 # ✅ Example usage
@@ -77,3 +260,5 @@ if __name__ == "__main__":
             print("❌ API Error:", response.status_code, response.text)
     except Exception as e:
         print("❗ Exception:", str(e))
+    finally:
+        oauth_client.close()
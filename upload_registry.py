@@ -0,0 +1,109 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+REGISTRY_PATH = os.getenv("UPLOAD_REGISTRY_PATH", ".cache/uploads.sqlite3")
+
+# Statuses the backend returns for a use-case id it no longer knows about.
+UNKNOWN_USE_CASE_STATUSES = (404, 410)
+
+
+class UploadRegistry:
+    """
+    Persistent content-addressed map of (backend, spec digest) -> (file_id, use_case_id).
+    Everything is keyed by backend base URL too: apps talking to different
+    backends share this file, and a use case only exists on the backend that made it.
+    """
+
+    def __init__(self, path: str = REGISTRY_PATH):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        for table in ("uploads", "manifests"):
+            columns = [row[1] for row in self._db.execute(f"PRAGMA table_info({table})")]
+            if columns and "backend" not in columns:
+                # Rows from before backends were recorded can't be attributed to one;
+                # dropping them only costs a fresh upload.
+                self._db.execute(f"DROP TABLE {table}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            "backend TEXT NOT NULL, digest TEXT NOT NULL, file_id TEXT, use_case_id TEXT NOT NULL, filename TEXT, "
+            "created REAL NOT NULL, PRIMARY KEY (backend, digest))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS manifests ("
+            "backend TEXT NOT NULL, spec_key TEXT NOT NULL, use_case_id TEXT NOT NULL, manifest TEXT NOT NULL, "
+            "updated REAL NOT NULL, PRIMARY KEY (backend, spec_key))"
+        )
+        self._db.commit()
+
+    def lookup(self, backend: str, digest: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT file_id, use_case_id, filename, created FROM uploads WHERE backend = ? AND digest = ?",
+                (backend, digest),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"file_id": row[0], "use_case_id": row[1], "filename": row[2], "created": row[3]}
+
+    def record(self, backend: str, digest: str, file_id: str, use_case_id: str, filename: str = ""):
+        if not use_case_id:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO uploads (backend, digest, file_id, use_case_id, filename, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (backend, digest, file_id, use_case_id, filename, time.time()),
+            )
+            self._db.commit()
+
+    def forget_digests(self, backend: str, use_case_id: str):
+        """
+        Drops every digest pointing at `use_case_id`, e.g. once it has been
+        changed in place and no longer holds those revisions.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM uploads WHERE backend = ? AND use_case_id = ?", (backend, use_case_id))
+            self._db.commit()
+
+    def last_manifest(self, backend: str, spec_key: str) -> tuple[str, dict] | None:
+        """
+        Returns (use_case_id, manifest) of the last revision of `spec_key` ingested into `backend`.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT use_case_id, manifest FROM manifests WHERE backend = ? AND spec_key = ?", (backend, spec_key)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def record_manifest(self, backend: str, spec_key: str, use_case_id: str, manifest: dict):
+        if not use_case_id:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO manifests (backend, spec_key, use_case_id, manifest, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (backend, spec_key, use_case_id, json.dumps(manifest), time.time()),
+            )
+            self._db.commit()
+
+    def invalidate_use_case(self, backend: str, use_case_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM uploads WHERE backend = ? AND use_case_id = ?", (backend, use_case_id))
+            self._db.execute("DELETE FROM manifests WHERE backend = ? AND use_case_id = ?", (backend, use_case_id))
+            self._db.commit()
+
+
+_default_registry = None
+
+
+def get_registry() -> UploadRegistry:
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = UploadRegistry()
+    return _default_registry